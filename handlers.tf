@@ -22,6 +22,42 @@ resource "aws_lambda_function" "members" {
   runtime          = "python3.8"
   timeout          = 60
   publish          = true
+
+  environment {
+    variables = {
+      OUTBOX_FUNCTION = "drain_outbox"
+    }
+  }
+}
+
+// Sends the transactional emails waiting in the outbox. Invoked
+// asynchronously by signup, and on a schedule to retry anything that failed
+resource "aws_lambda_function" "drain_outbox" {
+  filename         = data.archive_file.meadow_zip.output_path
+  function_name    = "drain_outbox"
+  role             = aws_iam_role.members.arn
+  handler          = "handler.drain_outbox"
+  source_code_hash = data.archive_file.meadow_zip.output_base64sha256
+  runtime          = "python3.8"
+  timeout          = 60
+  publish          = true
+}
+
+resource "aws_cloudwatch_event_rule" "drain_outbox" {
+  name                = "drain_outbox"
+  schedule_expression = "rate(5 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "drain_outbox" {
+  rule = aws_cloudwatch_event_rule.drain_outbox.name
+  arn  = aws_lambda_function.drain_outbox.arn
+}
+
+resource "aws_lambda_permission" "drain_outbox" {
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.drain_outbox.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.drain_outbox.arn
 }
 
 resource "aws_lambda_permission" "members" {
@@ -118,6 +154,21 @@ data "aws_iam_policy_document" "meadow-lambda" {
     ]
   }
 
+  // Newsletter sends and subscriber migrations re-invoke themselves to carry
+  // on after a timeout, and newsletter sends hand shards to
+  // send_newsletter_shard. Signups start drain_outbox
+  statement {
+    effect = "Allow"
+
+    resources = [
+      "*"
+    ]
+
+    actions = [
+      "lambda:InvokeFunction"
+    ]
+  }
+
   statement {
     effect = "Allow"
 
@@ -129,6 +180,32 @@ data "aws_iam_policy_document" "meadow-lambda" {
       "s3:GetObject"
     ]
   }
+
+  // Compiled templates shared between Lambdas, see S3BytecodeCache
+  statement {
+    effect = "Allow"
+
+    resources = [
+      "${aws_s3_bucket.barn.arn}/jinja2/bytecode/*"
+    ]
+
+    actions = [
+      "s3:PutObject"
+    ]
+  }
+
+  // Profiles of newsletter sends run with "profile": "s3", see SendProfiler
+  statement {
+    effect = "Allow"
+
+    resources = [
+      "${aws_s3_bucket.barn.arn}/profiles/*"
+    ]
+
+    actions = [
+      "s3:PutObject"
+    ]
+  }
 }
 
 // Send newsletter lambda
@@ -141,4 +218,34 @@ resource "aws_lambda_function" "send_newsletter" {
   runtime          = "python3.8"
   timeout          = 60
   publish          = true
-}
\ No newline at end of file
+
+  environment {
+    variables = {
+      NEWSLETTER_SHARD_FUNCTION = "send_newsletter_shard"
+    }
+  }
+}
+
+// Sends one shard of a newsletter split up by send_newsletter
+resource "aws_lambda_function" "send_newsletter_shard" {
+  filename         = data.archive_file.meadow_zip.output_path
+  function_name    = "send_newsletter_shard"
+  role             = aws_iam_role.members.arn
+  handler          = "handler.send_newsletter_shard"
+  source_code_hash = data.archive_file.meadow_zip.output_base64sha256
+  runtime          = "python3.8"
+  timeout          = 60
+  publish          = true
+}
+
+// Moves existing subscribers onto the subscribed_shard index, invoke by hand
+resource "aws_lambda_function" "migrate_subscribers" {
+  filename         = data.archive_file.meadow_zip.output_path
+  function_name    = "migrate_subscribers"
+  role             = aws_iam_role.members.arn
+  handler          = "handler.migrate_subscribers"
+  source_code_hash = data.archive_file.meadow_zip.output_base64sha256
+  runtime          = "python3.8"
+  timeout          = 60
+  publish          = true
+}
@@ -1,41 +1,449 @@
 import base64
+import collections
+import contextlib
+import functools
+import hashlib
+import hmac
+import itertools
 import json
 import logging
+import math
+import os
 import random
+import re
 import string
+import threading
+import time
 import urllib.parse
+import zlib
 from datetime import datetime
 
 import boto3
 import botocore
-from boto3.dynamodb.conditions import Key
-from jinja2 import Template
+from botocore.config import Config
 
+# Every endpoint needs boto3 to read the Meadow Dictionary, but Jinja and the
+# rest are only imported by the code that uses them, the first time it runs.
+# The API endpoints never render a template so never pay for Jinja.
 
-def initialise():
-    # Initialise Logger
-    logger = logging.getLogger()
+# Seconds a warm container trusts its copy of the MeadowDictionary before
+# re-reading it from SSM
+MEADOW_DICTIONARY_TTL = int(os.environ.get("MEADOW_DICTIONARY_TTL", "300"))
 
-    # Connect to SSM and load in the Meadow Dictionary
-    ssm = boto3.client("ssm")
-    try:
-        meadow = json.loads(
-            ssm.get_parameter(Name="MeadowDictionary")["Parameter"]["Value"]
-        )
-    except botocore.exceptions.ClientError as error:
-        logger.info("Could not retrieve MeadowDictionary SSM Parameter")
-        raise error
-    # Connect to the DynamoDB table
-    dynamodb = boto3.resource("dynamodb")
+# Seconds a cached barn template is used before checking S3 for a new version
+TEMPLATE_TTL = int(os.environ.get("TEMPLATE_TTL", "60"))
+
+# Where compiled template bytecode is kept, Lambda can only write under /tmp
+TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR", "/tmp/meadow-templates")
+
+# Where `make precompile-barn` leaves barn templates compiled into modules
+PRECOMPILED_TEMPLATES = os.environ.get(
+    "PRECOMPILED_TEMPLATES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "precompiled"),
+)
+
+# Subscribers fetched per DynamoDB query page when sending newsletters
+SUBSCRIBER_PAGE_SIZE = 1000
+
+# Sparse index of subscribers spread over SUBSCRIBED#<n> keys, used instead of
+# the is_subscribed index when the MeadowDictionary sets subscriber_shards
+SUBSCRIBER_SHARD_INDEX = "subscribed_shard"
+
+# Most destinations SES accepts in a single SendBulkTemplatedEmail call
+BULK_DESTINATIONS = 50
+
+# Worker threads sending a newsletter, and the most errors reported back from one
+SEND_CONCURRENCY = int(os.environ.get("SEND_CONCURRENCY", "10"))
+MAX_REPORTED_ERRORS = 100
+
+# Most worker threads a send's "concurrency" can ask for, AWS connection pools
+# are made this big so that no send thread ever waits on one
+MAX_SEND_CONCURRENCY = max(
+    int(os.environ.get("MAX_SEND_CONCURRENCY", "50")), SEND_CONCURRENCY
+)
+
+# Attempts at an SES call that was throttled, with jittered exponential backoff
+THROTTLE_RETRIES = 5
+THROTTLE_BACKOFF = 0.1
+
+# Stop sending a newsletter once the invocation has this long left to run
+SEND_DEADLINE_MARGIN_MS = int(os.environ.get("SEND_DEADLINE_MARGIN_MS", "10000"))
+
+# Outbox items drain_outbox reads at a time. A drain claims an item for longer
+# than it can run before sending it, and an item that has failed this many
+# times is parked under OUTBOX_FAILED instead of being retried forever.
+OUTBOX_PAGE_SIZE = 100
+OUTBOX_CLAIM_SECONDS = 120
+OUTBOX_MAX_ATTEMPTS = 5
+
+# Most items DynamoDB accepts in a single BatchWriteItem and BatchGetItem call
+BATCH_WRITE_ITEMS = 25
+BATCH_GET_ITEMS = 100
+
+# Attempts at re-writing UnprocessedItems, backing off exponentially between them
+BATCH_WRITE_RETRIES = 6
+BATCH_WRITE_BACKOFF = 0.05
+
+# Parallel BatchWriteItem calls import_subscribers makes, and scan segments
+# export_subscribers reads at once
+IMPORT_CONCURRENCY = 8
+EXPORT_SEGMENTS = 4
+
+# Seconds an export_subscribers reader waits for room in the queue before
+# checking whether the export was abandoned
+EXPORT_PUT_TIMEOUT = 0.1
+
+# Loose check that an imported address could be delivered to at all
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+
+# Attempts botocore makes at each AWS call, backing off adaptively when throttled
+CLIENT_MAX_ATTEMPTS = int(os.environ.get("CLIENT_MAX_ATTEMPTS", "3"))
+
+# CloudWatch namespace the per-invocation metrics are published under
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Meadow")
+
+# Where profiled newsletter sends leave their stats, see SendProfiler
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/meadow-profiles")
+
+
+def client_config():
+    # One connection per send thread, so concurrent sends reuse warm
+    # connections instead of queueing on the pool or opening new ones
+    options = {
+        "max_pool_connections": MAX_SEND_CONCURRENCY,
+        "retries": {"mode": "adaptive", "max_attempts": CLIENT_MAX_ATTEMPTS},
+    }
+    # tcp_keepalive is only understood by botocore 1.27 and later
     try:
-        table = dynamodb.Table(meadow["table"])
-    except botocore.exceptions.ClientError as error:
-        logger.info("Could not connect to DynamoDB Table")
-        raise error
+        return Config(tcp_keepalive=True, **options)
+    except TypeError:
+        return Config(**options)
+
+
+# Alphabet and length of the random_string in signup and unsubscribe links
+TOKEN_ALPHABET = string.ascii_uppercase + string.digits
+TOKEN_LENGTH = 32
+
+
+class TokenGenerator:
+    # Random strings for signup and unsubscribe links, cut from os.urandom a
+    # batch at a time rather than drawn from random one character at a time.
+    # Bytes are mapped onto the alphabet by rejection sampling: only bytes
+    # below the largest multiple of its length are kept, so every character
+    # is equally likely. Safe to share between send threads.
+    def __init__(self, length=TOKEN_LENGTH, alphabet=TOKEN_ALPHABET, batch=256):
+        self.length = length
+        self.batch = batch
+        limit = 256 - 256 % len(alphabet)
+        self.table = bytes(ord(alphabet[value % len(alphabet)]) for value in range(256))
+        self.rejected = bytes(range(limit, 256))
+        self.buffer = ""
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def tokens(self, count):
+        needed = count * self.length
+        with self.lock:
+            while len(self.buffer) - self.position < needed:
+                self.refill(max(needed, self.batch * self.length))
+            start, end = self.position, self.position + needed
+            chars = self.buffer[start:end]
+            self.position = end
+        bounds = range(0, needed + self.length, self.length)
+        return [chars[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def token(self):
+        return self.tokens(1)[0]
+
+    def refill(self, size):
+        # A few bytes are rejected, so read a little more than is needed
+        random_bytes = os.urandom(size + size // 16)
+        chars = random_bytes.translate(self.table, self.rejected).decode("ascii")
+        position = self.position
+        self.buffer = self.buffer[position:] + chars
+        self.position = 0
+
+
+_tokens = TokenGenerator()
+
+
+def random_token():
+    return _tokens.token()
+
+
+def random_tokens(count):
+    return _tokens.tokens(count)
+
+
+class InvocationMetrics:
+    # Timings and counts gathered over one invocation, logged as a single line
+    # of CloudWatch Embedded Metric Format when it finishes. Timings are totals
+    # in milliseconds and may overlap, e.g. send includes the ses calls it made
+    # and any time spent waiting on the rate limiter. Send threads share it.
+    COUNTERS = ("sends", "failures", "retries")
+
+    def __init__(self, function_name, clock=time.perf_counter):
+        self.function_name = function_name
+        self.clock = clock
+        self.started = clock()
+        self.timings = collections.Counter()
+        self.counts = collections.Counter({name: 0 for name in self.COUNTERS})
+        # Every duration as well as the totals, while a send is being profiled
+        self.samples = None
+        self.lock = threading.Lock()
+
+    def keep_samples(self):
+        with self.lock:
+            if self.samples is None:
+                self.samples = collections.defaultdict(list)
+
+    @contextlib.contextmanager
+    def time(self, name):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, (self.clock() - started) * 1000)
+
+    def record(self, name, milliseconds):
+        with self.lock:
+            self.timings[name] += milliseconds
+            if self.samples is not None:
+                self.samples[name].append(milliseconds)
+
+    def percentiles(self):
+        # p50, p95 and p99 of every timing sampled since keep_samples
+        with self.lock:
+            samples = dict(self.samples or {})
+        stages = {}
+        for name, durations in samples.items():
+            durations = sorted(durations)
+            stages[name] = {"count": len(durations)}
+            for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                stages[name][label] = round(percentile(durations, fraction), 3)
+        return stages
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def as_dict(self):
+        with self.lock:
+            timings = dict(self.timings)
+            counts = dict(self.counts)
+        timings["duration"] = (self.clock() - self.started) * 1000
+        metrics = [{"Name": name, "Unit": "Milliseconds"} for name in timings]
+        metrics += [{"Name": name, "Unit": "Count"} for name in counts]
+        line = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [["function"]],
+                        "Metrics": metrics,
+                    }
+                ],
+            },
+            "function": self.function_name,
+        }
+        line.update((name, round(value, 3)) for name, value in timings.items())
+        line.update(counts)
+        return line
+
+    def emit(self):
+        # Printed rather than logged, EMF has to be the whole log line
+        print(json.dumps(self.as_dict()), flush=True)
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def instrumented(handler):
+    # Gather metrics for each invocation of a Lambda entry point and log them
+    # once it returns or raises. A handler called from inside another adds to
+    # the metrics of the invocation it is part of.
+    @functools.wraps(handler)
+    def invoke(event, context):
+        meadow_context = get_context()
+        if meadow_context.metrics is not None:
+            return handler(event, context)
+        meadow_context.metrics = InvocationMetrics(handler.__name__)
+        try:
+            return handler(event, context)
+        finally:
+            metrics, meadow_context.metrics = meadow_context.metrics, None
+            metrics.emit()
+
+    return invoke
+
+
+def timed(name):
+    # Time a block into the current invocation's metrics, if there is one
+    metrics = get_context().metrics
+    return contextlib.nullcontext() if metrics is None else metrics.time(name)
+
 
-    return logger, meadow, table
+def count_metric(name, amount=1):
+    metrics = get_context().metrics
+    if metrics is not None:
+        metrics.count(name, amount)
 
 
+def instrument_client(client, service):
+    # Time every call the client makes under the service's name, and count
+    # the calls and the retries botocore made for them
+    def before_call(context, **kwargs):
+        context["meadow_started"] = time.perf_counter()
+
+    def after_call(context, parsed, **kwargs):
+        metrics = get_context().metrics
+        started = context.get("meadow_started")
+        if metrics is None or started is None:
+            return
+        metrics.record(service, (time.perf_counter() - started) * 1000)
+        metrics.count(service + "_calls")
+        retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if retries:
+            metrics.count("retries", retries)
+
+    client.meta.events.register("before-call", before_call)
+    client.meta.events.register("after-call", after_call)
+    return client
+
+
+class MeadowContext:
+    # Process-lifetime state shared by every invocation in a warm container.
+    # The MeadowDictionary is refreshed from SSM once it is older than the TTL,
+    # everything else is created on first use and kept until invalidated.
+    def __init__(self, ttl=MEADOW_DICTIONARY_TTL):
+        self.ttl = ttl
+        self.logger = logging.getLogger()
+        self.lock = threading.Lock()
+        # Set by instrumented for the invocation being handled
+        self.metrics = None
+        self.invalidate()
+
+    def invalidate(self):
+        self.meadow = None
+        self.loaded_at = None
+        self.ssm = None
+        self.dynamodb = None
+        self.table = None
+        self._ses = None
+        self._s3 = None
+        self.clients = {}
+        self.resources = {}
+        self.templates = {}
+        self.environment = None
+
+    def client(self, service):
+        # Every AWS client is created once, on first use, with client_config.
+        # Handlers must come through here rather than call boto3 themselves,
+        # so each call reuses the same connection pool.
+        with self.lock:
+            if service not in self.clients:
+                self.clients[service] = instrument_client(
+                    boto3.client(service, config=client_config()), service
+                )
+            return self.clients[service]
+
+    def resource(self, service):
+        # The same for boto3 resources
+        with self.lock:
+            if service not in self.resources:
+                resource = boto3.resource(service, config=client_config())
+                instrument_client(resource.meta.client, service)
+                self.resources[service] = resource
+            return self.resources[service]
+
+    @property
+    def ses(self):
+        # SES and S3 are only connected to by the endpoints that send email, the
+        # rest never pay for building their clients on a cold start
+        if self._ses is None:
+            self._ses = self.client("ses")
+        return self._ses
+
+    @ses.setter
+    def ses(self, ses):
+        self._ses = ses
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            self._s3 = self.resource("s3")
+        return self._s3
+
+    @s3.setter
+    def s3(self, s3):
+        self._s3 = s3
+
+    def expired(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def load(self):
+        if not self.expired():
+            return
+
+        # Connect to SSM and load in the Meadow Dictionary
+        if self.ssm is None:
+            self.ssm = self.client("ssm")
+        try:
+            with timed("ssm_load"):
+                parameter = self.ssm.get_parameter(Name="MeadowDictionary")
+            meadow = json.loads(parameter["Parameter"]["Value"])
+        except botocore.exceptions.ClientError as error:
+            self.logger.info("Could not retrieve MeadowDictionary SSM Parameter")
+            raise error
+
+        # Only reconnect to DynamoDB if the table has moved
+        if self.meadow is None or self.meadow["table"] != meadow["table"]:
+            self.table = None
+        # Templates are recompiled if their shared bytecode cache has moved
+        if template_cache_location(self.meadow) != template_cache_location(meadow):
+            self.environment = None
+        self.meadow = meadow
+        self.loaded_at = time.monotonic()
+
+        # Connect to the DynamoDB table
+        if self.table is None:
+            if self.dynamodb is None:
+                self.dynamodb = self.resource("dynamodb")
+            try:
+                self.table = self.dynamodb.Table(self.meadow["table"])
+            except botocore.exceptions.ClientError as error:
+                self.logger.info("Could not connect to DynamoDB Table")
+                raise error
+
+
+def template_cache_location(meadow):
+    if meadow is None or not meadow.get("template_cache"):
+        return None
+    return meadow["barn"], meadow["template_cache"]
+
+
+_context = MeadowContext()
+
+
+def get_context():
+    return _context
+
+
+def invalidate_context():
+    # Drop everything cached for this container, the next invocation starts cold
+    _context.invalidate()
+
+
+def initialise():
+    _context.load()
+    return _context.logger, _context.meadow, _context.table
+
+
+@instrumented
 def signup(event, context):
     # Initialise
     logger, meadow, table = initialise()
@@ -56,18 +464,33 @@ def signup(event, context):
         logger.info("Secret does not match or does not exist")
         raise error
 
-    # Add email and random_string to table, if it doesn't already exist
-    random_string = "".join(
-        random.choices(string.ascii_uppercase + string.digits, k=32)
-    )
+    # Add email and random_string to table, if it doesn't already exist, and
+    # queue the validation email in the outbox in the same transaction
+    random_string = random_token()
+    email_sent_date = datetime.now().strftime("%Y%m%d%H%M%S")
     try:
-        table.put_item(
-            Item={
-                "partitionKey": email,
-                "sortKey": "NEWSLETTER_SIGNUP",
-                "random_string": random_string,
-            },
-            ConditionExpression="attribute_not_exists(partitionKey)",
+        table.meta.client.transact_write_items(
+            TransactItems=[
+                {
+                    "Put": {
+                        "TableName": table.name,
+                        "Item": {
+                            "partitionKey": email,
+                            "sortKey": "NEWSLETTER_SIGNUP",
+                            "random_string": random_string,
+                        },
+                        "ConditionExpression": "attribute_not_exists(partitionKey)",
+                    }
+                },
+                {
+                    "Put": {
+                        "TableName": table.name,
+                        "Item": outbox_item(
+                            "validation", email, random_string, email_sent_date
+                        ),
+                    }
+                },
+            ]
         )
     except botocore.exceptions.ClientError:
         logger.info("Email already exists!")
@@ -81,9 +504,170 @@ def signup(event, context):
             },
         }
 
-    # Send Validation Email
-    # This needs an EXTENSIVE rewrite once we start sending newsletters!
-    email_sent_date = datetime.now().strftime("%Y%m%d%H%M%S")
+    # The outbox is drained by another invocation, so the redirect doesn't
+    # wait on S3 and SES. If that can't be started the scheduled drain will
+    # still send the email.
+    try:
+        start_outbox_drain()
+    except Exception as error:
+        logger.info("Could not start outbox drain: %s", error)
+
+    # Never tell the user what happened, any error should be internal
+    return {
+        "statusCode": 301,
+        "headers": {
+            "Location": "https://" + meadow["website_domain"] + "/newsletter_validating"
+        },
+    }
+
+
+def outbox_item(kind, email, random_string, email_sent_date):
+    # Transactional emails wait under the OUTBOX partition, oldest first, until
+    # drain_outbox has sent them
+    return {
+        "partitionKey": "OUTBOX",
+        "sortKey": "OUTBOX#" + email_sent_date + "#" + email,
+        "kind": kind,
+        "email": email,
+        "random_string": random_string,
+        "email_sent_date": email_sent_date,
+    }
+
+
+def start_outbox_drain():
+    # In Lambda this is an asynchronous invocation of OUTBOX_FUNCTION; wherever
+    # that isn't set, such as the tests, the outbox is drained in-process
+    worker = os.environ.get("OUTBOX_FUNCTION")
+    if not worker:
+        drain_outbox({}, None)
+        return
+    get_context().client("lambda").invoke(
+        FunctionName=worker, InvocationType="Event", Payload=b"{}"
+    )
+
+
+@instrumented
+def drain_outbox(event, context):
+    # Sends every email waiting in the outbox and deletes each item once its
+    # email is out. Every signup starts a drain, so each item is claimed
+    # before it is sent and drains running at the same time skip the items
+    # another has claimed. Anything that fails is released for the next
+    # drain, which also runs on a schedule, so each email goes out at least
+    # once unless it keeps failing and is parked.
+    from boto3.dynamodb.conditions import Key
+
+    logger, meadow, table = initialise()
+
+    summary = SendSummary()
+    # Read consistently, the drain a signup starts has to see its item
+    query = {
+        "KeyConditionExpression": Key("partitionKey").eq("OUTBOX"),
+        "Limit": OUTBOX_PAGE_SIZE,
+        "ConsistentRead": True,
+    }
+    drain = functools.partial(drain_outbox_item, table)
+    while True:
+        page = table.query(**query)
+        # Whatever goes wrong with one email, the rest are still sent
+        outcomes = map_bounded(drain, page["Items"], SEND_CONCURRENCY, Exception)
+        for item, claimed, error in outcomes:
+            if error is not None:
+                logger.info("Could not send outbox email: %s", error)
+                summary.add(item["email"], error)
+            elif claimed:
+                summary.add(item["email"], None)
+
+        if "LastEvaluatedKey" not in page:
+            return summary.as_dict()
+        query["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def drain_outbox_item(table, item):
+    # Claim an outbox item, send its email and delete it. Returns False when
+    # another drain holds the claim. If sending fails the claim is released,
+    # or the item parked once it has used up its attempts, and the error
+    # raised.
+    key = {"partitionKey": item["partitionKey"], "sortKey": item["sortKey"]}
+    now = int(time.time())
+    try:
+        item = table.update_item(
+            Key=key,
+            UpdateExpression="SET claimed_until = :until ADD attempts :one",
+            ConditionExpression="attribute_exists(partitionKey) AND "
+            "(attribute_not_exists(claimed_until) OR claimed_until < :now)",
+            ExpressionAttributeValues={
+                ":until": now + OUTBOX_CLAIM_SECONDS,
+                ":one": 1,
+                ":now": now,
+            },
+            ReturnValues="ALL_NEW",
+        )["Attributes"]
+    except botocore.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise error
+        return False
+
+    try:
+        send_outbox_item(item)
+    except Exception as error:
+        if int(item["attempts"]) >= OUTBOX_MAX_ATTEMPTS:
+            park_outbox_item(table, item, error)
+        else:
+            table.update_item(Key=key, UpdateExpression="REMOVE claimed_until")
+        raise error
+
+    table.delete_item(Key=key)
+    return True
+
+
+def park_outbox_item(table, item, error):
+    # Move an item that keeps failing out of the outbox, keeping it and its
+    # last error under OUTBOX_FAILED to be looked into
+    get_context().logger.info("Giving up on outbox email: %s", item["sortKey"])
+    parked = dict(item, partitionKey="OUTBOX_FAILED", error=str(error))
+    del parked["claimed_until"]
+    table.meta.client.transact_write_items(
+        TransactItems=[
+            {"Put": {"TableName": table.name, "Item": parked}},
+            {
+                "Delete": {
+                    "TableName": table.name,
+                    "Key": {
+                        "partitionKey": item["partitionKey"],
+                        "sortKey": item["sortKey"],
+                    },
+                }
+            },
+        ]
+    )
+
+
+def send_outbox_item(item):
+    if item["kind"] != "validation":
+        raise ValueError("Unknown outbox email: " + item["kind"])
+    send_validation_email(item, None)
+
+
+@instrumented
+def send_validation_email(event, context):
+    # Initialise
+    logger, meadow, table = initialise()
+
+    email = event["email"]
+    random_string = event["random_string"]
+    email_sent_date = event["email_sent_date"]
+
+    # An outbox item can be sent again if it wasn't deleted, or by two drains
+    # at once, and the repeat finds its EMAIL_SENT record and stops there
+    sent = table.get_item(
+        Key={"partitionKey": email, "sortKey": "EMAIL_SENT#" + email_sent_date},
+        ProjectionExpression="partitionKey",
+        ConsistentRead=True,
+    )
+    if "Item" in sent:
+        logger.info("Validation email already sent")
+        return
+
     subject = (
         "Confirm your request to receive the " + meadow["organisation"] + " newsletter"
     )
@@ -94,7 +678,7 @@ def signup(event, context):
             meadow["barn"], "transactional/validate.j2"
         )
     except Exception as error:
-        logger.info("Could not load template: ", error)
+        logger.info("Could not load template: %s", error)
         raise error
 
     validation_url = (
@@ -106,24 +690,18 @@ def signup(event, context):
         + random_string
     )
 
-    unsubscribe_url = (
-        "https://"
-        + meadow["meadow_domain"]
-        + "/unsubscribe?email="
-        + base64.urlsafe_b64encode(email.encode()).decode("ascii")
-        + "&random_string="
-        + random_string
-        + "&email_sent="
-        + email_sent_date
+    unsubscribe_url = build_unsubscribe_url(
+        meadow, email, random_string, email_sent_date
     )
 
-    body_html = validation_html_template.render(
-        validation_path=validation_url, unsubscribe_path=unsubscribe_url
-    )
+    with timed("render"):
+        body_html = validation_html_template.render(
+            validation_path=validation_url, unsubscribe_path=unsubscribe_url
+        )
 
-    body_text = validation_text_template.render(
-        validation_path=validation_url, unsubscribe_path=unsubscribe_url
-    )
+        body_text = validation_text_template.render(
+            validation_path=validation_url, unsubscribe_path=unsubscribe_url
+        )
 
     try:
         send_email(
@@ -140,15 +718,8 @@ def signup(event, context):
         logger.info("Could not send validation email.")
         raise error
 
-    # Never tell the user what happened, any error should be internal
-    return {
-        "statusCode": 301,
-        "headers": {
-            "Location": "https://" + meadow["website_domain"] + "/newsletter_validating"
-        },
-    }
-
 
+@instrumented
 def unsubscribe(event, context):
     # Initialise
     logger, meadow, table = initialise()
@@ -159,25 +730,68 @@ def unsubscribe(event, context):
             event["queryStringParameters"]["email"].encode("ascii")
         ).decode()
     except base64.binascii.Error as error:
-        logger("Cannot decode email string")
+        logger.info("Cannot decode email string")
         raise error
 
-    # Load in random_string
+    # Load in email_sent date
     try:
-        random_string = event["queryStringParameters"]["random_string"]
+        email_sent = event["queryStringParameters"]["email_sent"]
     except KeyError as error:
-        logger("Cannot fetch random_string")
+        logger.info("Cannot fetch email_sent date")
         raise error
 
-    # Load in email_sent date
+    # Signed links carry an HMAC over the email and email_sent date, which is
+    # checked without reading the table
+    signature = event["queryStringParameters"].get("signature")
+    if signature is not None:
+        try:
+            assert verify_unsubscribe_signature(meadow, email, email_sent, signature)
+        except AssertionError as error:
+            logger.info("Unsubscribe signature does not match!")
+            raise error
+    else:
+        verify_unsubscribe_record(event, table, email, email_sent)
+
+    # With a sharded subscriber index unsubscribed users are dropped from the
+    # indexes altogether, rather than kept under is_subscribed = "false"
+    if subscriber_shards(meadow):
+        update = {"UpdateExpression": "REMOVE is_subscribed, subscribed_shard"}
+    else:
+        update = {
+            "UpdateExpression": "SET is_subscribed = :x",
+            "ExpressionAttributeValues": {":x": "false"},
+        }
     try:
-        email_sent = event["queryStringParameters"]["email_sent"]
+        table.update_item(
+            Key={"partitionKey": email, "sortKey": "NEWSLETTER_SIGNUP"},
+            ConditionExpression="attribute_exists(partitionKey)",
+            **update,
+        )
+    except botocore.exceptions.ClientError as error:
+        logger.info("Email does not exist!")
+        raise error
+
+    return {
+        "statusCode": 301,
+        "headers": {
+            "Location": "https://"
+            + meadow["website_domain"]
+            + "/newsletter_unsubscribed"
+        },
+    }
+
+
+def verify_unsubscribe_record(event, table, email, email_sent):
+    logger = get_context().logger
+
+    # Load in random_string
+    try:
+        random_string = event["queryStringParameters"]["random_string"]
     except KeyError as error:
-        logger("Cannot fetch email_sent date")
+        logger.info("Cannot fetch random_string")
         raise error
 
     # Check email exists, and newsletter_date & random_string matches a newsletter
-    # Then set is_subscribed to False
     try:
         validate_email_sent = table.get_item(
             Key={
@@ -197,26 +811,23 @@ def unsubscribe(event, context):
         )
         raise error
 
-    try:
-        table.update_item(
-            Key={"partitionKey": email, "sortKey": "NEWSLETTER_SIGNUP"},
-            UpdateExpression="SET is_subscribed = :x",
-            ExpressionAttributeValues={":x": "false"},
-        )
-    except botocore.exceptions.ClientError as error:
-        logger.info("Email does not exist!")
-        raise error
 
-    return {
-        "statusCode": 301,
-        "headers": {
-            "Location": "https://"
-            + meadow["website_domain"]
-            + "/newsletter_unsubscribed"
-        },
-    }
+def unsubscribe_signature(secret, email, email_sent_date):
+    # HMAC-SHA256 over the email and the date its email was sent, URL-safe
+    message = (email_sent_date + ":" + email).encode("utf-8")
+    digest = hmac.new(secret.encode("utf-8"), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
 
+def verify_unsubscribe_signature(meadow, email, email_sent_date, signature):
+    secret = meadow.get("unsubscribe_secret")
+    if not secret:
+        return False
+    expected = unsubscribe_signature(secret, email, email_sent_date)
+    return hmac.compare_digest(expected.encode("utf-8"), signature.encode("utf-8"))
 
+
+@instrumented
 def validate(event, context):
     # Initialise
     logger, meadow, table = initialise()
@@ -227,22 +838,31 @@ def validate(event, context):
             event["queryStringParameters"]["email"].encode("ascii")
         ).decode()
     except base64.binascii.Error as error:
-        logger("Cannot decode email string")
+        logger.info("Cannot decode email string")
         raise error
 
     # Load in random_string
     try:
         random_string = event["queryStringParameters"]["random_string"]
     except KeyError as error:
-        logger("Cannot fetch random_string")
+        logger.info("Cannot fetch random_string")
         raise error
 
-    # Check email exists, random_string matches, then subscribe the user
+    # Check email exists, random_string matches, then subscribe the user. With a
+    # sharded subscriber index only subscribed_shard is written, so signups
+    # don't all land on the single is_subscribed = "true" index key
+    shards = subscriber_shards(meadow)
+    if shards:
+        update = "SET subscribed_shard = :s REMOVE is_subscribed"
+        values = {":s": subscriber_shard(email, shards), ":y": random_string}
+    else:
+        update = "SET is_subscribed = :x"
+        values = {":x": "true", ":y": random_string}
     try:
         table.update_item(
             Key={"partitionKey": email, "sortKey": "NEWSLETTER_SIGNUP"},
-            UpdateExpression="SET is_subscribed = :x",
-            ExpressionAttributeValues={":x": "true", ":y": random_string},
+            UpdateExpression=update,
+            ExpressionAttributeValues=values,
             ConditionExpression="attribute_exists(partitionKey) AND random_string = :y",
         )
     except botocore.exceptions.ClientError as error:
@@ -257,9 +877,129 @@ def validate(event, context):
     }
 
 
+@instrumented
 def send_newsletter(event, context):
     # Initialise
     logger, meadow, table = initialise()
+    newsletter_slug, newsletter_subject = load_newsletter_details(event)
+
+    # Large lists are split into shards for send_newsletter_shard to send
+    if event.get("shards"):
+        return start_sharded_newsletter(event, newsletter_slug)
+
+    # Pick up where an unfinished send of this newsletter stopped, if any
+    campaign = Campaign.load(table, newsletter_slug, restart=event.get("restart"))
+    # A send split into shards keeps its progress in the shards, carrying on
+    # without them would send to everyone again
+    if campaign.total_segments is not None:
+        raise ValueError(
+            "Newsletter is being sent in shards, carry on with shards or restart it."
+        )
+    page_size = event.get("page_size", SUBSCRIBER_PAGE_SIZE)
+    shards = subscriber_shards(meadow)
+
+    def read_pages(start_key):
+        if shards:
+            return iter_subscriber_shard_pages(
+                table, range(shards), page_size, start_key
+            )
+        return iter_subscriber_pages(table, page_size, start_key)
+
+    return deliver_newsletter(event, context, campaign, read_pages)
+
+
+@instrumented
+def send_newsletter_shard(event, context):
+    # Send a newsletter to one shard of the subscriber list, as described by
+    # one of the shard descriptors from start_sharded_newsletter
+    logger, meadow, table = initialise()
+    newsletter_slug, newsletter_subject = load_newsletter_details(event)
+
+    try:
+        segment = int(event["segment"])
+        total_segments = int(event["total_segments"])
+        email_sent_date = event["email_sent_date"]
+    except KeyError as error:
+        logger.info("Could not load shard details from event")
+        raise error
+
+    campaign = Campaign.load(
+        table, newsletter_slug, shard=segment, email_sent_date=email_sent_date
+    )
+    page_size = event.get("page_size", SUBSCRIBER_PAGE_SIZE)
+    # Each worker queries its share of the SUBSCRIBED#<n> keys of a sharded
+    # subscriber index, otherwise its segment of a scan
+    shards = subscriber_shards(meadow)
+
+    def read_pages(start_key):
+        if shards:
+            return iter_subscriber_shard_pages(
+                table, range(segment, shards, total_segments), page_size, start_key
+            )
+        return iter_subscriber_segment_pages(
+            table, segment, total_segments, page_size, start_key
+        )
+
+    return deliver_newsletter(event, context, campaign, read_pages)
+
+
+def start_sharded_newsletter(event, newsletter_slug):
+    # Split a newsletter send into shards, one parallel scan segment each, and
+    # hand each one to a send_newsletter_shard invocation when one is set up
+    logger, meadow, table = initialise()
+
+    # Fail now rather than in every shard if the template is broken
+    try:
+        load_template_source(meadow["barn"], "newsletters/" + newsletter_slug + ".j2")
+    except Exception as error:
+        logger.info("Could not load template: %s", error)
+        raise error
+
+    # Re-running the coordinator carries on with the same send, keeping the
+    # shards it was first split into
+    campaign = Campaign.load(table, newsletter_slug, restart=event.get("restart"))
+    if campaign.complete:
+        logger.info("Newsletter has already been sent")
+        return {"email_sent_date": campaign.email_sent_date, "shards": []}
+    # Shards only know who has been sent to within their own segment, so a
+    # send that was started unsharded has to be finished the same way
+    if campaign.resumed and campaign.total_segments is None:
+        raise ValueError(
+            "Newsletter is part way through an unsharded send, carry on without"
+            " shards or restart it."
+        )
+    total_segments = campaign.total_segments or int(event["shards"])
+    # A sharded subscriber index splits no further than its SUBSCRIBED#<n> keys
+    if campaign.total_segments is None and subscriber_shards(meadow):
+        total_segments = min(total_segments, subscriber_shards(meadow))
+    campaign.shard_out(total_segments)
+
+    shard_event = {key: value for key, value in event.items() if key != "shards"}
+    shard_event.pop("restart", None)
+    shards = [
+        dict(
+            shard_event,
+            email_sent_date=campaign.email_sent_date,
+            segment=segment,
+            total_segments=total_segments,
+        )
+        for segment in range(total_segments)
+    ]
+
+    worker = os.environ.get("NEWSLETTER_SHARD_FUNCTION")
+    if worker:
+        for shard in shards:
+            get_context().client("lambda").invoke(
+                FunctionName=worker,
+                InvocationType="Event",
+                Payload=json.dumps(shard),
+            )
+
+    return {"email_sent_date": campaign.email_sent_date, "shards": shards}
+
+
+def load_newsletter_details(event):
+    logger = get_context().logger
 
     # Load details from event
     try:
@@ -277,108 +1017,1293 @@ def send_newsletter(event, context):
     ):
         raise ValueError("Newsletter slug and newsletter subject cannot be empty.")
 
+    return newsletter_slug, newsletter_subject
+
+
+def deliver_newsletter(event, context, campaign, read_pages):
+    # Send a newsletter to every subscriber read_pages(start_key) yields,
+    # resuming and checkpointing campaign as it goes
+    logger = get_context().logger
+    meadow = get_context().meadow
+    table = get_context().table
+    newsletter_slug = event["newsletter_slug"]
+    newsletter_subject = event["newsletter_subject"]
+
+    if campaign.complete:
+        logger.info("Newsletter has already been sent")
+        return campaign.summary(SendSummary(), None)
+
     try:
-        validation_html_template, validation_text_template = load_template(
+        html_source, text_source = load_template_source(
             meadow["barn"], "newsletters/" + newsletter_slug + ".j2"
         )
     except Exception as error:
-        logger.info("Could not load template: ", error)
+        logger.info("Could not load template: %s", error)
         raise error
 
-    # Load subscribers from users table
-    try:
-        subscribers = table.query(
-            IndexName="is_subscribed",
-            KeyConditionExpression=Key("is_subscribed").eq("true"),
-        )
-    except botocore.exceptions.ClientError as error:
-        logger.info("Could not load subscribers from users table")
-        raise Exception("Could not load subscribers from users table", error)
-
     # Set common newsletter attributes
-    email_sent_date = datetime.now().strftime("%Y%m%d%H%M%S")
-    subject = newsletter_subject
+    email_sent_date = campaign.email_sent_date
     sender = meadow["organisation"] + " <noreply@" + meadow["meadow_domain"] + ">"
+    concurrency = min(
+        int(event.get("concurrency", SEND_CONCURRENCY)), MAX_SEND_CONCURRENCY
+    )
+
+    # Optionally buffer EMAIL_SENT# records and write them in batches
+    sent_records = SentRecordBuffer(table) if event.get("batch_writes") else None
+    newsletter = NewsletterSend(
+        meadow, table, sender, newsletter_subject, email_sent_date, sent_records
+    )
+
+    # Profile the sends when asked to, "profile": "s3" copies the results to
+    # the barn as well as leaving them in PROFILE_DIR. Every invocation of a
+    # send that carries on after a timeout writes its own.
+    if event.get("profile"):
+        name = newsletter_slug + "-" + email_sent_date
+        if "segment" in event:
+            name += "-shard" + str(event["segment"])
+        newsletter.profiler = SendProfiler(name + "-" + str(int(time.time() * 1000)))
+
+    # In bulk mode SES renders the newsletter itself from an uploaded template
+    template_name = None
+    if event.get("bulk"):
+        template_name = upload_bulk_template(
+            newsletter_slug, newsletter_subject, html_source, text_source
+        )
+        if not template_name:
+            logger.info("Newsletter cannot be sent as an SES template, sending singly")
+
+    if template_name:
+
+        def send_page(subscribers):
+            return send_bulk_newsletter(
+                newsletter, template_name, subscribers, concurrency
+            )
+
+    else:
+        html_template, text_template = load_template(
+            meadow["barn"], "newsletters/" + newsletter_slug + ".j2"
+        )
+        html_template = compile_newsletter_template(html_source, html_template)
+        text_template = compile_newsletter_template(text_source, text_template)
+
+        def send_page(subscribers):
+            return send_newsletter_singly(
+                newsletter, html_template, text_template, subscribers, concurrency
+            )
+
+    # Pace sends under the account's SES quota and stop once it runs out. The
+    # shards of a sharded send run at once, so each gets its share of it
+    limiter = SendRateLimiter(
+        get_context().ses, share=int(event.get("total_segments", 1))
+    )
+    newsletter.limiter = limiter
+
+    # Stop cleanly before Lambda times out, leaving the rest for the next run
+    def keep_sending(_=None):
+        if limiter.exhausted:
+            return False
+        if context is None:
+            return True
+        return context.get_remaining_time_in_millis() > SEND_DEADLINE_MARGIN_MS
+
+    # Stream subscribers from users table a page at a time, checkpointing the
+    # campaign after each page that has been completely sent
+    summary = SendSummary()
+    resume_key = campaign.start_key
+    pages = read_pages(campaign.start_key)
+    try:
+        for subscribers, next_key in pages:
+            # A resumed send may already have reached some of this page, if it
+            # was stopped without a checkpoint. Signed sends have no EMAIL_SENT
+            # records to check that against.
+            if campaign.resumed and not newsletter.signed:
+                subscribers = unsent_subscribers(table, subscribers, email_sent_date)
+
+            attempted = 0
+            for email, error in send_page(
+                itertools.takewhile(keep_sending, subscribers)
+            ):
+                # Running out of daily quota stops the send before this
+                # recipient rather than failing them, the next run carries on
+                # from here once there is quota again
+                if quota_exhausted(error):
+                    break
+                summary.add(email, error)
+                attempted += 1
+
+            # Stopped part way through the page, the next run carries on after
+            # the last subscriber this one dealt with
+            if attempted < len(subscribers):
+                if attempted:
+                    resume_key = subscribers[attempted - 1]
+                break
+            if sent_records is not None:
+                sent_records.flush()
+            campaign.checkpoint(summary, next_key, complete=next_key is None)
+            resume_key = next_key
+            if not keep_sending():
+                break
+    finally:
+        if sent_records is not None:
+            sent_records.flush()
+        # Keep the totals right even when stopping part way through a page
+        if not campaign.complete:
+            campaign.checkpoint(summary, resume_key)
+
+    if not campaign.complete and limiter.exhausted:
+        logger.info("SES daily sending quota exhausted, newsletter not finished")
+    elif not campaign.complete:
+        logger.info("Out of time, newsletter will carry on from its checkpoint")
+        continue_newsletter(event, context)
+
+    response = campaign.summary(summary, limiter)
+    if sent_records is not None:
+        response["unwritten_records"] = len(sent_records.unwritten)
+    if newsletter.profiler is not None:
+        bucket_name = meadow["barn"] if event["profile"] == "s3" else None
+        response["profile"] = newsletter.profiler.write(bucket_name=bucket_name)
+    return response
 
-    # Iterate over subscribers and send them the newsletter
-    for subscriber in subscribers["Items"]:
 
+def continue_newsletter(event, context):
+    # Hand the rest of the send to a fresh asynchronous invocation
+    if context is None or not getattr(context, "invoked_function_arn", None):
+        return
+    get_context().client("lambda").invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps(dict(event, restart=False)),
+    )
+
+
+def unsent_subscribers(table, subscribers, email_sent_date):
+    # Drop subscribers that already have an EMAIL_SENT# record for this send
+    sent = set()
+    for batch in iter_batches(subscribers, BATCH_GET_ITEMS):
+        request = {
+            table.name: {
+                "Keys": [
+                    {
+                        "partitionKey": subscriber["partitionKey"],
+                        "sortKey": "EMAIL_SENT#" + email_sent_date,
+                    }
+                    for subscriber in batch
+                ],
+                "ProjectionExpression": "partitionKey",
+            }
+        }
+        while request:
+            response = table.meta.client.batch_get_item(RequestItems=request)
+            sent.update(
+                item["partitionKey"] for item in response["Responses"][table.name]
+            )
+            request = response.get("UnprocessedKeys")
+
+    return [
+        subscriber
+        for subscriber in subscribers
+        if subscriber["partitionKey"] not in sent
+    ]
+
+
+def send_newsletter_singly(
+    newsletter, html_template, text_template, subscribers, concurrency=1
+):
+    # Render and send the newsletter to each subscriber, yielding an
+    # (email, error) outcome for every one of them in subscriber order
+    def send_to_subscriber(subscriber):
         # Add the email to a more descriptive variable name
         email = subscriber["partitionKey"]
 
-        # Create random string for each user (for unsubscribes)
-        random_string = "".join(
-            random.choices(string.ascii_uppercase + string.digits, k=32)
-        )
+        # Create random string for each user (for unsubscribes), not needed
+        # when the unsubscribe link is signed
+        random_string = None if newsletter.signed else random_token()
 
         # Create Unsubscribe address
-        unsubscribe_url = (
-            "https://"
-            + meadow["meadow_domain"]
-            + "/unsubscribe?email="
-            + base64.urlsafe_b64encode(email.encode()).decode("ascii")
-            + "&random_string="
-            + random_string
-            + "&email_sent="
-            + email_sent_date
+        unsubscribe_url = build_unsubscribe_url(
+            newsletter.meadow, email, random_string, newsletter.email_sent_date
         )
 
         # Render HTML and Text body for the newsletter
-        body_html = validation_html_template.render(unsubscribe_path=unsubscribe_url)
-        body_text = validation_text_template.render(unsubscribe_path=unsubscribe_url)
+        with timed("render"):
+            body_html = html_template.render(unsubscribe_path=unsubscribe_url)
+            body_text = text_template.render(unsubscribe_path=unsubscribe_url)
 
         # Attempt to send the newsletter
+        send_email(
+            newsletter.sender,
+            email,
+            newsletter.subject,
+            newsletter.email_sent_date,
+            body_html,
+            body_text,
+            random_string,
+            None if newsletter.signed else newsletter.table,
+            newsletter.sent_records,
+            newsletter.limiter,
+        )
+
+    if newsletter.profiler is not None:
+        send_to_subscriber = newsletter.profiler.wrap(send_to_subscriber)
+
+    logger = get_context().logger
+    for subscriber, _, error in map_bounded(
+        send_to_subscriber, subscribers, concurrency
+    ):
+        if error:
+            logger.info("Could not send newsletter: %s", error)
+        yield subscriber["partitionKey"], error
+
+
+def iter_subscriber_pages(table, page_size=SUBSCRIBER_PAGE_SIZE, start_key=None):
+    # Query the is_subscribed index one page at a time, following
+    # LastEvaluatedKey so lists larger than 1 MB are not truncated. Yields each
+    # page's items along with the key to resume after it (None on the last page).
+    # Items hold just the index key, so any of them can be resumed after too.
+    from boto3.dynamodb.conditions import Key
+
+    query = {
+        "IndexName": "is_subscribed",
+        "KeyConditionExpression": Key("is_subscribed").eq("true"),
+        "ProjectionExpression": "partitionKey, sortKey, is_subscribed",
+    }
+    return iter_pages(table.query, query, page_size, start_key)
+
+
+def iter_subscriber_segment_pages(
+    table,
+    segment,
+    total_segments,
+    page_size=SUBSCRIBER_PAGE_SIZE,
+    start_key=None,
+    sharded=False,
+):
+    # The same as iter_subscriber_pages, but for one segment of a parallel scan
+    # over the is_subscribed index, or the subscribed_shard index when sharded.
+    # That index is sparse, everyone in it is subscribed so nothing is filtered
+    from boto3.dynamodb.conditions import Attr
+
+    scan = {"Segment": segment, "TotalSegments": total_segments}
+    if sharded:
+        scan["IndexName"] = SUBSCRIBER_SHARD_INDEX
+        scan["ProjectionExpression"] = "partitionKey, sortKey, subscribed_shard"
+    else:
+        scan["IndexName"] = "is_subscribed"
+        scan["FilterExpression"] = Attr("is_subscribed").eq("true")
+        scan["ProjectionExpression"] = "partitionKey, sortKey, is_subscribed"
+    return iter_pages(table.scan, scan, page_size, start_key)
+
+
+def iter_subscriber_shard_pages(
+    table, shards, page_size=SUBSCRIBER_PAGE_SIZE, start_key=None
+):
+    # The same as iter_subscriber_pages, but querying the given SUBSCRIBED#<n>
+    # keys of the subscribed_shard index one after another. Between shards the
+    # key to resume after names only the next shard, to be read from its start
+    from boto3.dynamodb.conditions import Key
+
+    keys = ["SUBSCRIBED#" + str(shard) for shard in shards]
+    if not keys:
+        # Still one empty last page, so a worker with no keys finishes its send
+        yield [], None
+        return
+    if start_key:
+        first = keys.index(start_key["subscribed_shard"])
+        keys = keys[first:]
+        if set(start_key) == {"subscribed_shard"}:
+            start_key = None
+
+    for position, shard_key in enumerate(keys):
+        query = {
+            "IndexName": SUBSCRIBER_SHARD_INDEX,
+            "KeyConditionExpression": Key("subscribed_shard").eq(shard_key),
+            "ProjectionExpression": "partitionKey, sortKey, subscribed_shard",
+        }
+        following = keys[position + 1] if position + 1 < len(keys) else None
+        for items, next_key in iter_pages(table.query, query, page_size, start_key):
+            if next_key is not None:
+                next_key = dict(next_key, subscribed_shard=shard_key)
+            elif following is not None:
+                next_key = {"subscribed_shard": following}
+            yield items, next_key
+        start_key = None
+
+
+def subscriber_shards(meadow):
+    # How many SUBSCRIBED#<n> keys subscribers are spread over, 0 when the
+    # is_subscribed index is used instead
+    return int(meadow.get("subscriber_shards") or 0)
+
+
+def subscriber_shard(email, shards):
+    # The same subscriber always hashes to the same shard, in every container
+    return "SUBSCRIBED#" + str(zlib.crc32(email.encode("utf-8")) % shards)
+
+
+@instrumented
+def migrate_subscribers(event, context):
+    # Bring existing NEWSLETTER_SIGNUP rows into line with subscriber_shards:
+    # subscribers are given their subscribed_shard, or moved to their new one if
+    # the number of shards changed, and everyone loses is_subscribed. Safe to
+    # re-run, and carries on in a fresh invocation when short of time
+    logger, meadow, table = initialise()
+    from boto3.dynamodb.conditions import Attr
+
+    shards = int(event.get("shards") or subscriber_shards(meadow))
+    if not shards:
+        raise ValueError("subscriber_shards is not set in the MeadowDictionary.")
+
+    scan = {
+        "FilterExpression": Attr("sortKey").eq("NEWSLETTER_SIGNUP"),
+        "ProjectionExpression": "partitionKey, is_subscribed, subscribed_shard",
+    }
+    page_size = event.get("page_size", SUBSCRIBER_PAGE_SIZE)
+    start_key = event.get("start_key")
+    migrated = collections.Counter()
+    for items, start_key in iter_pages(table.scan, scan, page_size, start_key):
+        for item in items:
+            migrated[migrate_subscriber(table, item, shards)] += 1
+        if context is not None and (
+            context.get_remaining_time_in_millis() <= SEND_DEADLINE_MARGIN_MS
+        ):
+            break
+
+    if start_key and context is not None:
+        logger.info("Out of time, subscriber migration will carry on")
+        get_context().client("lambda").invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType="Event",
+            Payload=json.dumps(dict(event, shards=shards, start_key=start_key)),
+        )
+
+    return {
+        "subscribed": migrated["subscribed"],
+        "unsubscribed": migrated["unsubscribed"],
+        "unchanged": migrated["unchanged"],
+        "start_key": start_key,
+    }
+
+
+def migrate_subscriber(table, item, shards):
+    # Conditional on the subscription state read, so a concurrent validate or
+    # unsubscribe wins. Sharded subscribers have only subscribed_shard
+    key = {"partitionKey": item["partitionKey"], "sortKey": "NEWSLETTER_SIGNUP"}
+    if item.get("is_subscribed") == "true" or "subscribed_shard" in item:
+        shard_key = subscriber_shard(item["partitionKey"], shards)
+        if item.get("subscribed_shard") == shard_key and "is_subscribed" not in item:
+            return "unchanged"
+        update = {
+            "UpdateExpression": "SET subscribed_shard = :s REMOVE is_subscribed",
+            "ConditionExpression": "is_subscribed = :x "
+            "OR attribute_exists(subscribed_shard)",
+            "ExpressionAttributeValues": {":s": shard_key, ":x": "true"},
+        }
+        outcome = "subscribed"
+    elif "is_subscribed" in item:
+        update = {
+            "UpdateExpression": "REMOVE is_subscribed",
+            "ConditionExpression": "is_subscribed <> :x "
+            "AND attribute_not_exists(subscribed_shard)",
+            "ExpressionAttributeValues": {":x": "true"},
+        }
+        outcome = "unsubscribed"
+    else:
+        return "unchanged"
+
+    try:
+        table.update_item(Key=key, **update)
+    except botocore.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise error
+        return "unchanged"
+    return outcome
+
+
+def import_subscribers(
+    lines, offset=0, concurrency=IMPORT_CONCURRENCY, progress=None, file_format=None
+):
+    # Add subscribers from an export of another provider's list, a CSV with an
+    # email column or JSON lines with an email key, without validation emails.
+    # Records before offset are skipped, and the returned offset is where a
+    # re-run carries on from after a failure. Addresses already in the table
+    # are left alone, so nobody who unsubscribed is signed back up
+    logger, meadow, table = initialise()
+    shards = subscriber_shards(meadow)
+    summary = {"imported": 0, "existing": 0, "invalid": 0, "errors": []}
+    started = time.monotonic()
+
+    def write_batch(batch):
+        end, emails, invalid = batch
+        existing = existing_emails(table, emails)
+        new = [email for email in emails if email not in existing]
+        items = [subscriber_item(email, shards) for email in new]
+        unwritten = []
+        for chunk in iter_batches(items, BATCH_WRITE_ITEMS):
+            unwritten.extend(batch_write_items(table, chunk))
+        return len(new), len(unwritten)
+
+    records = read_subscriber_records(lines, file_format)
+    batches = iter_import_batches(itertools.islice(records, offset, None), offset)
+    for (end, emails, invalid), written, error in map_bounded(
+        write_batch, batches, concurrency
+    ):
+        # Stop at the first batch that didn't make it, so everything before
+        # offset is known to be in the table
+        if error is None and written[1]:
+            error = "Could not write " + str(written[1]) + " subscribers"
+        if error:
+            logger.info("Could not import subscribers: %s", error)
+            summary["errors"].append({"offset": offset, "error": str(error)})
+            break
+        imported = written[0]
+        summary["imported"] += imported
+        summary["existing"] += len(emails) - imported
+        summary["invalid"] += invalid
+        offset = end
+        if progress is not None:
+            progress(dict(summary, offset=offset), time.monotonic() - started)
+
+    elapsed = time.monotonic() - started
+    summary.update(
+        offset=offset,
+        seconds=round(elapsed, 3),
+        per_second=round(summary["imported"] / elapsed, 1) if elapsed else 0.0,
+    )
+    return summary
+
+
+def read_subscriber_records(lines, file_format=None):
+    # Yields one email (or None for a record without one) per CSV row or JSON
+    # line, where file_format is "csv" or "jsonl" and is guessed from the first
+    # line when not given. A JSON line that isn't an object with an email
+    # string is a record without one too.
+    import csv
+
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain([first], lines)
+    if file_format is None:
+        file_format = "jsonl" if first.lstrip().startswith("{") else "csv"
+
+    if file_format == "jsonl":
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            email = record.get("email") if isinstance(record, dict) else None
+            yield email if isinstance(email, str) else None
+        return
+
+    rows = csv.reader(lines)
+    first_row = next(rows)
+    header = [name.strip().lower() for name in first_row]
+    column = header.index("email") if "email" in header else 0
+    # A file without a header row starts with an address
+    if "email" not in header:
+        rows = itertools.chain([first_row], rows)
+    for row in rows:
+        yield row[column] if len(row) > column else None
+
+
+def iter_import_batches(records, offset):
+    # Group valid, de-duplicated emails into batches of BATCH_GET_ITEMS, each
+    # with the offset of the record after its last one and the number of
+    # invalid records it skipped
+    batch = []
+    invalid = 0
+    for offset, email in enumerate(records, start=offset + 1):
+        email = (email or "").strip()
+        if len(email) > 254 or not EMAIL_PATTERN.fullmatch(email):
+            invalid += 1
+            continue
+        if email in batch:
+            continue
+        batch.append(email)
+        if len(batch) == BATCH_GET_ITEMS:
+            yield offset, batch, invalid
+            batch = []
+            invalid = 0
+    yield offset, batch, invalid
+
+
+def existing_emails(table, emails):
+    # The emails that already have a NEWSLETTER_SIGNUP record
+    existing = set()
+    if not emails:
+        return existing
+    request = {
+        table.name: {
+            "Keys": [
+                {"partitionKey": email, "sortKey": "NEWSLETTER_SIGNUP"}
+                for email in emails
+            ],
+            "ProjectionExpression": "partitionKey",
+        }
+    }
+    while request:
+        response = table.meta.client.batch_get_item(RequestItems=request)
+        existing.update(
+            item["partitionKey"] for item in response["Responses"][table.name]
+        )
+        request = response.get("UnprocessedKeys")
+    return existing
+
+
+def subscriber_item(email, shards):
+    # A validated subscriber, the same record validate leaves behind
+    item = {
+        "partitionKey": email,
+        "sortKey": "NEWSLETTER_SIGNUP",
+        "random_string": random_token(),
+    }
+    if shards:
+        item["subscribed_shard"] = subscriber_shard(email, shards)
+    else:
+        item["is_subscribed"] = "true"
+    return item
+
+
+def export_subscribers(segments=EXPORT_SEGMENTS, page_size=SUBSCRIBER_PAGE_SIZE):
+    # Stream every subscriber's email out of the is_subscribed index, or the
+    # subscribed_shard index when sharded, with a parallel scan of one thread
+    # per segment. Emails come out in no order
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+
+    logger, meadow, table = initialise()
+    sharded = bool(subscriber_shards(meadow))
+    pages = queue.Queue(maxsize=segments * 2)
+    finished = object()
+    # Set when the caller stops reading early, so readers waiting for room in
+    # the queue give up rather than holding up the pool's shutdown forever
+    stopped = threading.Event()
+
+    def put(page):
+        while not stopped.is_set():
+            try:
+                pages.put(page, timeout=EXPORT_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_segment(segment):
+        try:
+            for items, _ in iter_subscriber_segment_pages(
+                table, segment, segments, page_size, sharded=sharded
+            ):
+                if not put(items):
+                    return
+        finally:
+            put(finished)
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        readers = [pool.submit(read_segment, segment) for segment in range(segments)]
+        try:
+            running = segments
+            while running:
+                items = pages.get()
+                if items is finished:
+                    running -= 1
+                    continue
+                for item in items:
+                    yield item["partitionKey"]
+        finally:
+            stopped.set()
+        for reader in readers:
+            reader.result()
+
+
+def iter_pages(read, request, page_size, start_key):
+    if page_size:
+        request["Limit"] = page_size
+
+    while True:
+        if start_key:
+            request["ExclusiveStartKey"] = start_key
+        try:
+            page = read(**request)
+        except botocore.exceptions.ClientError as error:
+            get_context().logger.info("Could not load subscribers from users table")
+            raise Exception("Could not load subscribers from users table", error)
+
+        start_key = page.get("LastEvaluatedKey")
+        yield page["Items"], start_key
+        if not start_key:
+            return
+
+
+def build_unsubscribe_url(meadow, email, random_string, email_sent_date):
+    # Links are signed once the Meadow Dictionary has an unsubscribe_secret,
+    # otherwise unsubscribe checks the random_string in the EMAIL_SENT record
+    url = (
+        "https://"
+        + meadow["meadow_domain"]
+        + "/unsubscribe?email="
+        + base64.urlsafe_b64encode(email.encode()).decode("ascii")
+    )
+    if meadow.get("unsubscribe_secret"):
+        signature = unsubscribe_signature(
+            meadow["unsubscribe_secret"], email, email_sent_date
+        )
+        return url + "&email_sent=" + email_sent_date + "&signature=" + signature
+    return url + "&random_string=" + random_string + "&email_sent=" + email_sent_date
+
+
+def is_plain_substitution(source, name):
+    # True when every use of name in the template is a bare {{ name }}, the
+    # only form whose output can be swapped for another value after rendering.
+    # Filters, tests, loops over it and assignments to it all make this False,
+    # as does output inside blocks that filter, escape or capture what they hold.
+    from jinja2 import nodes
+
+    ast = template_environment().parse(source)
+    wrappers = (
+        nodes.FilterBlock,
+        nodes.Scope,
+        nodes.CallBlock,
+        nodes.Macro,
+        nodes.AssignBlock,
+        nodes.EvalContextModifier,
+    )
+    wrapped = {
+        id(node)
+        for wrapper in ast.find_all(wrappers)
+        for node in wrapper.find_all(nodes.Name)
+    }
+    uses = [node for node in ast.find_all(nodes.Name) if node.name == name]
+    plain = [
+        child
+        for output in ast.find_all(nodes.Output)
+        for child in output.nodes
+        if isinstance(child, nodes.Name)
+        and child.name == name
+        and id(child) not in wrapped
+    ]
+    return len(uses) == len(plain)
+
+
+class SplicedTemplate:
+    # A newsletter template rendered once with a sentinel in place of
+    # unsubscribe_path and split around it. Rendering for a recipient only
+    # joins the static segments with their link, escaped the way Jinja would.
+    def __init__(self, template, segments):
+        from markupsafe import escape
+
+        self.segments = segments
+        autoescape = template.environment.autoescape
+        if callable(autoescape):
+            autoescape = autoescape(template.name)
+        self.escape = escape if autoescape else str
+
+    @classmethod
+    def from_source(cls, source, template=None):
+        # Returns None if unsubscribe_path is used in a way splicing can't copy
+        if not is_plain_substitution(source, "unsubscribe_path"):
+            return None
+        if template is None:
+            from jinja2 import Template
+
+            template = Template(source)
+        sentinel = "MEADOW-UNSUBSCRIBE-PATH-" + os.urandom(8).hex()
+        rendered = template.render(unsubscribe_path=sentinel)
+        spliced = cls(template, rendered.split(sentinel))
+
+        # Anything the parse can't see, the sentinel being changed or escaped
+        # differently, shows up as splicing not matching a real render
+        check = "MEADOW-UNSUBSCRIBE-CHECK-" + os.urandom(8).hex() + "?a=1&b=<'\">"
+        if spliced.render(check) != template.render(unsubscribe_path=check):
+            return None
+        return spliced
+
+    def render(self, unsubscribe_path):
+        # str() so Markup doesn't escape the already rendered segments too
+        return str(self.escape(unsubscribe_path)).join(self.segments)
+
+
+def compile_newsletter_template(source, template=None):
+    # Splice in unsubscribe links where possible, fully render where not
+    with timed("template_compile"):
+        if template is None:
+            from jinja2 import Template
+
+            template = Template(source)
+        return SplicedTemplate.from_source(source, template) or template
+
+
+def ses_template_part(source):
+    # Convert a newsletter template into an SES (Handlebars) template part,
+    # or return None when it uses something SES cannot reproduce
+    spliced = SplicedTemplate.from_source(source)
+    if spliced is None:
+        return None
+
+    # Anything that already looks like Handlebars would be re-rendered by SES
+    if any("{{" in segment or "}}" in segment for segment in spliced.segments):
+        return None
+
+    # Triple braces stop SES escaping the URL, matching the Jinja output
+    return "{{{unsubscribe_path}}}".join(spliced.segments)
+
+
+def upload_bulk_template(newsletter_slug, subject, html_source, text_source):
+    # Upload the newsletter as an SES template, returning its name or None if
+    # the newsletter has to be rendered per recipient instead
+    html_part = ses_template_part(html_source)
+    text_part = ses_template_part(text_source)
+    if html_part is None or text_part is None or "{{" in subject:
+        return None
+
+    # SES template names are limited to 64 letters, digits, - and _
+    template_name = "meadow-" + re.sub(r"[^A-Za-z0-9_-]", "-", newsletter_slug)
+    template = {
+        "TemplateName": template_name[:64],
+        "SubjectPart": subject,
+        "HtmlPart": html_part,
+        "TextPart": text_part,
+    }
+
+    ses = get_context().ses
+    try:
+        ses.create_template(Template=template)
+    except botocore.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] != "AlreadyExists":
+            raise error
+        ses.update_template(Template=template)
+
+    return template["TemplateName"]
+
+
+def send_bulk_newsletter(newsletter, template_name, subscribers, concurrency=1):
+    # Send an uploaded SES template to subscribers, BULK_DESTINATIONS at a time,
+    # yielding an (email, error) outcome for every subscriber in order
+    def send_batch(emails):
+        return send_bulk_batch(newsletter, template_name, emails)
+
+    if newsletter.profiler is not None:
+        send_batch = newsletter.profiler.wrap(send_batch)
+
+    logger = get_context().logger
+    batches = iter_batches(
+        (subscriber["partitionKey"] for subscriber in subscribers), BULK_DESTINATIONS
+    )
+    for emails, outcomes, error in map_bounded(send_batch, batches, concurrency):
+        if error:
+            logger.info("Could not send newsletter batch: %s", error)
+            outcomes = [(email, error) for email in emails]
+        yield from outcomes
+
+
+def send_bulk_batch(newsletter, template_name, emails):
+    logger = get_context().logger
+    ses = get_context().ses
+
+    # Send only as many destinations as the daily quota has room for, the rest
+    # are left unsent for the next run to carry on from
+    send = ses.send_bulk_templated_email
+    unsent = []
+    if newsletter.limiter is not None:
+        allowed = newsletter.limiter.acquire(len(emails), partial=True)
+        emails, unsent = emails[:allowed], emails[allowed:]
+        send = newsletter.limiter.retrying(send)
+
+    # Each destination gets its own unsubscribe link
+    if newsletter.signed:
+        random_strings = [None] * len(emails)
+    else:
+        random_strings = random_tokens(len(emails))
+    destinations = [
+        {
+            "Destination": {"ToAddresses": [email]},
+            "ReplacementTemplateData": json.dumps(
+                {
+                    "unsubscribe_path": build_unsubscribe_url(
+                        newsletter.meadow,
+                        email,
+                        random_string,
+                        newsletter.email_sent_date,
+                    )
+                }
+            ),
+        }
+        for email, random_string in zip(emails, random_strings)
+    ]
+
+    with timed("send"), counted_send(len(destinations), count_sends=False):
+        response = send(
+            Source=newsletter.sender,
+            Template=template_name,
+            DefaultTemplateData=json.dumps({"unsubscribe_path": ""}),
+            Destinations=destinations,
+        )
+
+    # Statuses come back in the same order as the destinations
+    outcomes = []
+    for email, random_string, status in zip(emails, random_strings, response["Status"]):
+        if status["Status"] == "AccountDailyQuotaExceeded":
+            if newsletter.limiter is not None:
+                newsletter.limiter.exhausted = True
+            outcomes.append((email, SendQuotaExhausted(status["Status"])))
+            continue
+        if status["Status"] != "Success":
+            logger.info("Could not send newsletter: %s", status.get("Error"))
+            count_metric("failures")
+            outcomes.append((email, status.get("Error", status["Status"])))
+            continue
+        count_metric("sends")
+        if newsletter.signed:
+            outcomes.append((email, None))
+            continue
         try:
-            send_email(
-                sender,
+            record_email_sent(
+                newsletter.table,
                 email,
-                subject,
-                email_sent_date,
-                body_html,
-                body_text,
+                newsletter.email_sent_date,
                 random_string,
-                table,
+                newsletter.sent_records,
             )
         except botocore.exceptions.ClientError as error:
-            logger.info("Could not send newsletter: ", error)
-            continue
+            logger.info("Could not record sent newsletter: %s", error)
+        outcomes.append((email, None))
 
-    return 0
+    quota_error = SendQuotaExhausted("SES daily sending quota exhausted")
+    outcomes.extend((email, quota_error) for email in unsent)
+    return outcomes
 
 
-def send_email(
-    sender, recipient, subject, sent_date, body_html, body_text, random_string, table
-):
-    # Connect to SES
-    ses = boto3.client("ses")
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    charset = "UTF-8"
 
-    # Attempt to send
-    ses.send_email(
-        Destination={
-            "ToAddresses": [
-                recipient,
-            ],
-        },
-        Message={
-            "Body": {
-                "Html": {
-                    "Charset": charset,
-                    "Data": body_html,
-                },
-                "Text": {
-                    "Charset": charset,
-                    "Data": body_text,
-                },
-            },
-            "Subject": {
-                "Charset": charset,
-                "Data": subject,
-            },
-        },
-        Source=sender,
+def map_bounded(function, items, concurrency, errors=None):
+    # Call function on each item from a pool of worker threads, yielding
+    # (item, result, error) in the order the items arrived. No more than twice
+    # the concurrency is in flight at once, so a streamed list is never pulled
+    # into memory. Only errors (send errors by default) are caught, anything
+    # else is raised.
+    errors = errors or SEND_ERRORS
+    if concurrency <= 1:
+        for item in items:
+            try:
+                yield item, function(item), None
+            except errors as error:
+                yield item, None, error
+        return
+
+    def finish(item, future):
+        try:
+            return item, future.result(), None
+        except errors as error:
+            return item, None, error
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = collections.deque()
+        for item in items:
+            in_flight.append((item, pool.submit(function, item)))
+            if len(in_flight) >= concurrency * 2:
+                yield finish(*in_flight.popleft())
+        while in_flight:
+            yield finish(*in_flight.popleft())
+
+
+class Campaign:
+    # Progress of one newsletter send, checkpointed in the users table so that
+    # a send which runs out of time can be resumed by the next invocation
+    def __init__(self, table, slug, email_sent_date, shard=None, resumed=False):
+        self.table = table
+        self.slug = slug
+        self.email_sent_date = email_sent_date
+        self.resumed = resumed
+        self.start_key = None
+        self.complete = False
+        self.sent = 0
+        self.failed = 0
+        self.total_segments = None
+        # Each shard of a sharded send keeps its own checkpoint
+        self.key = {
+            "partitionKey": "CAMPAIGN#" + slug,
+            "sortKey": "CAMPAIGN" if shard is None else "SHARD#" + str(shard),
+        }
+
+    @classmethod
+    def load(cls, table, slug, restart=False, shard=None, email_sent_date=None):
+        campaign = cls(table, slug, email_sent_date, shard)
+        state = table.get_item(Key=campaign.key, ConsistentRead=True).get("Item")
+        # A shard resumes only if it belongs to the same send
+        if state is not None and email_sent_date:
+            restart = restart or state["email_sent_date"] != email_sent_date
+        if state is None or restart:
+            if not email_sent_date:
+                campaign.email_sent_date = datetime.now().strftime("%Y%m%d%H%M%S")
+            return campaign
+
+        campaign.email_sent_date = state["email_sent_date"]
+        campaign.resumed = True
+        campaign.start_key = state.get("start_key")
+        campaign.complete = state["status"] == "complete"
+        campaign.sent = int(state["sent"])
+        campaign.failed = int(state["failed"])
+        if "total_segments" in state:
+            campaign.total_segments = int(state["total_segments"])
+        return campaign
+
+    def shard_out(self, total_segments):
+        # Mark the send as split into shards, which keep their own progress
+        self.table.put_item(
+            Item=dict(
+                self.key,
+                email_sent_date=self.email_sent_date,
+                status="sharded",
+                total_segments=total_segments,
+                sent=0,
+                failed=0,
+            )
+        )
+
+    def checkpoint(self, summary, start_key=None, complete=False):
+        # Record that everything before start_key has been dealt with, along
+        # with the running totals including this run's summary
+        self.start_key = start_key
+        self.complete = complete
+        item = dict(
+            self.key,
+            email_sent_date=self.email_sent_date,
+            status="complete" if complete else "sending",
+            sent=self.sent + summary.sent,
+            failed=self.failed + summary.failed,
+        )
+        if start_key:
+            item["start_key"] = start_key
+        self.table.put_item(Item=item)
+
+    def summary(self, summary, limiter):
+        # This run's summary, plus the campaign's running totals
+        result = dict(
+            summary.as_dict(),
+            email_sent_date=self.email_sent_date,
+            complete=self.complete,
+            total_sent=self.sent + summary.sent,
+            total_failed=self.failed + summary.failed,
+        )
+        if limiter is not None:
+            result["remaining_quota"] = limiter.remaining
+            result["quota_exhausted"] = limiter.exhausted
+        return result
+
+
+class NewsletterSend:
+    # The parts of a newsletter send that are the same for every recipient
+    def __init__(
+        self, meadow, table, sender, subject, email_sent_date, sent_records=None
+    ):
+        self.meadow = meadow
+        self.table = table
+        self.sender = sender
+        self.subject = subject
+        self.email_sent_date = email_sent_date
+        self.sent_records = sent_records
+        self.limiter = None
+        self.profiler = None
+        # Signed unsubscribe links need no EMAIL_SENT records
+        self.signed = bool(meadow.get("unsubscribe_secret"))
+
+
+class SendProfiler:
+    # cProfile for the per-recipient (or per-batch) hot path of a newsletter
+    # send. A profile only sees the thread it is enabled in, so each send
+    # thread gets its own and they are merged when the stats are written. The
+    # invocation's metrics keep every duration meanwhile, so render, send and
+    # AWS call latencies can be reported as percentiles too.
+    def __init__(self, name):
+        import cProfile
+
+        self.name = name
+        self.factory = cProfile.Profile
+        self.local = threading.local()
+        self.profiles = []
+        self.lock = threading.Lock()
+        metrics = get_context().metrics
+        if metrics is not None:
+            metrics.keep_samples()
+
+    def wrap(self, function):
+        def profiled(*args):
+            profile = getattr(self.local, "profile", None)
+            if profile is None:
+                profile = self.local.profile = self.factory()
+                with self.lock:
+                    self.profiles.append(profile)
+            return profile.runcall(function, *args)
+
+        return profiled
+
+    def write(self, directory=None, bucket_name=None, prefix="profiles/"):
+        # Save the merged stats, for pstats or snakeviz, and the percentiles as
+        # JSON. Both are copied under prefix in bucket_name when it is given.
+        import pstats
+
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        metrics = get_context().metrics
+        stages = metrics.percentiles() if metrics is not None else {}
+        paths = [os.path.join(directory, self.name + ".json")]
+        with open(paths[0], "w") as stages_file:
+            json.dump(stages, stages_file, indent=2)
+        with self.lock:
+            profiles = list(self.profiles)
+        if profiles:
+            paths.append(os.path.join(directory, self.name + ".prof"))
+            pstats.Stats(*profiles).dump_stats(paths[1])
+
+        report = {"stages": stages, "files": paths}
+        if bucket_name:
+            client = get_context().s3.meta.client
+            report["s3_keys"] = []
+            for path in paths:
+                key = prefix + os.path.basename(path)
+                with open(path, "rb") as profile_file:
+                    client.put_object(
+                        Bucket=bucket_name, Key=key, Body=profile_file.read()
+                    )
+                report["s3_keys"].append(key)
+        return report
+
+
+class SendSummary:
+    # Counts of what happened to each recipient, returned from send_newsletter.
+    # Errors are kept in recipient order, up to MAX_REPORTED_ERRORS of them.
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.errors = []
+
+    def add(self, email, error=None):
+        if error is None:
+            self.sent += 1
+            return
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"email": email, "error": str(error)})
+
+    def as_dict(self):
+        return {"sent": self.sent, "failed": self.failed, "errors": self.errors}
+
+
+class SendQuotaExhausted(Exception):
+    pass
+
+
+# Errors that fail a single recipient (or batch) rather than the whole send
+SEND_ERRORS = (botocore.exceptions.ClientError, SendQuotaExhausted)
+
+
+def quota_exhausted(error):
+    # Whether a send was turned away only because the daily sending quota ran
+    # out, so the recipient has not been sent to and is not a failure
+    if isinstance(error, SendQuotaExhausted):
+        return True
+    return (
+        isinstance(error, botocore.exceptions.ClientError)
+        and error.response["Error"]["Code"] == "Throttling"
+        and "Daily message quota exceeded" in error.response["Error"]["Message"]
     )
+
+
+class SendRateLimiter:
+    # Token bucket keeping SES calls under the account's MaxSendRate. The send
+    # quota is read once when the limiter is created, and every message sent
+    # through it is taken off the remaining Max24HourSend allowance. Senders
+    # running side by side each take a share of the rate and allowance.
+    def __init__(
+        self,
+        ses,
+        retries=THROTTLE_RETRIES,
+        backoff=THROTTLE_BACKOFF,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        share=1,
+    ):
+        quota = ses.get_send_quota()
+        self.rate = quota["MaxSendRate"] / share
+        # A Max24HourSend of -1 means the account has no daily limit
+        if quota["Max24HourSend"] < 0:
+            self.remaining = None
+        else:
+            left = quota["Max24HourSend"] - quota["SentLast24Hours"]
+            self.remaining = int(left / share)
+        self.exhausted = self.remaining is not None and self.remaining <= 0
+
+        self.retries = retries
+        self.backoff = backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.capacity = max(self.rate, 1)
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, count=1, partial=False):
+        # Take count messages from the bucket, waiting for it to refill if it
+        # runs dry. Tokens are reserved under the lock and waited for outside
+        # it, so concurrent senders queue up behind each other's debt. With
+        # partial, as many of count as the daily quota has left are taken.
+        # Returns how many messages were taken.
+        with self.lock:
+            if self.remaining is not None:
+                if self.remaining < count:
+                    if not partial or not self.remaining:
+                        self.exhausted = True
+                        raise SendQuotaExhausted("SES daily sending quota exhausted")
+                    count = self.remaining
+                self.remaining -= count
+                self.exhausted = self.remaining == 0
+            now = self.clock()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            self.sleep(wait)
+        return count
+
+    def wrap(self, send, count=1):
+        # Pace calls to send, retrying the ones SES throttles
+        retrying = self.retrying(send)
+
+        def paced(**kwargs):
+            self.acquire(count)
+            return retrying(**kwargs)
+
+        return paced
+
+    def retrying(self, send):
+        # Retry calls to send that SES throttles, with jittered backoff
+        def retried(**kwargs):
+            for attempt in range(self.retries + 1):
+                try:
+                    return send(**kwargs)
+                except botocore.exceptions.ClientError as error:
+                    if not self.throttled(error) or attempt == self.retries:
+                        raise error
+                count_metric("retries")
+                self.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+        return retried
+
+    def throttled(self, error):
+        if error.response["Error"]["Code"] != "Throttling":
+            return False
+        # Running out of daily quota is throttling too, but waiting won't help
+        if quota_exhausted(error):
+            with self.lock:
+                self.exhausted = True
+            return False
+        return True
+
+
+class SentRecordBuffer:
+    # Write-behind buffer for EMAIL_SENT# records. Records are queued as emails
+    # go out and written with BatchWriteItem once a full batch is waiting, or
+    # when flushed. Unlike record_email_sent these writes are unconditional.
+    def __init__(self, table, retries=BATCH_WRITE_RETRIES, backoff=BATCH_WRITE_BACKOFF):
+        self.table = table
+        self.retries = retries
+        self.backoff = backoff
+        self.pending = []
+        self.unwritten = []
+        # Send workers share the buffer, batches are written outside the lock
+        self.lock = threading.Lock()
+
+    def add(self, recipient, sent_date, random_string):
+        item = {
+            "partitionKey": recipient,
+            "sortKey": "EMAIL_SENT#" + sent_date,
+            "random_string": random_string,
+        }
+        with self.lock:
+            self.pending.append(item)
+            if len(self.pending) < BATCH_WRITE_ITEMS:
+                return
+            batch = self.take()
+        self.write(batch)
+
+    def flush(self):
+        while True:
+            with self.lock:
+                batch = self.take()
+            if not batch:
+                return
+            self.write(batch)
+
+    def take(self):
+        batch = self.pending[:BATCH_WRITE_ITEMS]
+        self.pending = self.pending[BATCH_WRITE_ITEMS:]
+        return batch
+
+    def write(self, batch):
+        unwritten = batch_write_items(self.table, batch, self.retries, self.backoff)
+        if not unwritten:
+            return
+
+        # Out of retries, write what is left one record at a time. Anything that
+        # still fails is kept and reported, those recipients have been sent a
+        # newsletter whose unsubscribe link won't work.
+        logger = get_context().logger
+        logger.info("Could not batch write all sent records, writing them singly")
+        failed = []
+        for item in unwritten:
+            try:
+                self.table.put_item(Item=item)
+            except botocore.exceptions.ClientError as error:
+                logger.info("Could not record sent newsletter: %s", error)
+                failed.append(item)
+        with self.lock:
+            self.unwritten.extend(failed)
+
+
+def batch_write_items(
+    table, items, retries=BATCH_WRITE_RETRIES, backoff=BATCH_WRITE_BACKOFF
+):
+    # Put up to BATCH_WRITE_ITEMS items with BatchWriteItem, re-writing any
+    # UnprocessedItems with exponential backoff. Returns the items never written
+    request = {table.name: [{"PutRequest": {"Item": item}} for item in items]}
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            response = table.meta.client.batch_write_item(RequestItems=request)
+        except botocore.exceptions.ClientError as error:
+            get_context().logger.info("Could not write batch to users table: %s", error)
+            continue
+        request = response.get("UnprocessedItems")
+        if not request:
+            return []
+
+    return [put["PutRequest"]["Item"] for put in request[table.name]]
+
+
+def record_email_sent(table, recipient, sent_date, random_string, sent_records=None):
+    # Queue the record when buffering, otherwise write it straight away
+    if sent_records is not None:
+        sent_records.add(recipient, sent_date, random_string)
+        return
+
     table.put_item(
         Item={
             "partitionKey": recipient,
@@ -389,15 +2314,258 @@ def send_email(
     )
 
 
-def load_template(bucket_name, template_key):
-    # Load email template from bucket
-    s3 = boto3.resource("s3")
+def send_email(
+    sender,
+    recipient,
+    subject,
+    sent_date,
+    body_html,
+    body_text,
+    random_string,
+    table,
+    sent_records=None,
+    limiter=None,
+):
+    # Connect to SES
+    ses = get_context().ses
 
+    charset = "UTF-8"
+
+    # Attempt to send, paced by the rate limiter when there is one
+    send = ses.send_email if limiter is None else limiter.wrap(ses.send_email)
+    with timed("send"), counted_send(1):
+        send(
+            Destination={
+                "ToAddresses": [
+                    recipient,
+                ],
+            },
+            Message={
+                "Body": {
+                    "Html": {
+                        "Charset": charset,
+                        "Data": body_html,
+                    },
+                    "Text": {
+                        "Charset": charset,
+                        "Data": body_text,
+                    },
+                },
+                "Subject": {
+                    "Charset": charset,
+                    "Data": subject,
+                },
+            },
+            Source=sender,
+        )
+    if table is not None:
+        record_email_sent(table, recipient, sent_date, random_string, sent_records)
+
+
+@contextlib.contextmanager
+def counted_send(messages, count_sends=True):
+    # Count messages as failures if sending them raises, or as sent if not
     try:
-        combined_template = (
-            s3.Object(bucket_name, template_key).get()["Body"].read().decode("utf-8")
+        yield
+    except Exception as error:
+        if not quota_exhausted(error):
+            count_metric("failures", messages)
+        raise
+    if count_sends:
+        count_metric("sends", messages)
+
+
+def load_template(bucket_name, template_key):
+    # Both halves of a barn template, compiled through the shared environment
+    # so they are cached in memory and their bytecode on disk
+    environment = template_environment()
+    name = bucket_name + "/" + template_key
+    with timed("template_compile"):
+        validation_html_template = environment.get_template(name + ":html")
+        validation_text_template = environment.get_template(name + ":text")
+
+    return validation_html_template, validation_text_template
+
+
+def template_environment():
+    # The Jinja environment every barn template is compiled in, created once
+    # per container. Compiled templates are kept in memory until S3 has a new
+    # version, and their bytecode is cached in TEMPLATE_CACHE_DIR so that
+    # recompiling a template Jinja has seen before is only a load from disk.
+    # Setting template_cache in the Meadow Dictionary to a key prefix also
+    # shares the bytecode through the barn, so cold starts skip compiling too.
+    # Templates precompiled into the package are tried before any of that.
+    from jinja2 import ChoiceLoader, Environment, FunctionLoader
+    from jinja2.bccache import FileSystemBytecodeCache, S3BytecodeCache
+
+    context = get_context()
+    if context.environment is None:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        shared = None
+        location = template_cache_location(context.meadow)
+        if location is not None:
+            shared = S3BytecodeCache(context.s3.meta.client, *location)
+        loader = FunctionLoader(load_barn_template)
+        precompiled = PrecompiledTemplates.find(PRECOMPILED_TEMPLATES)
+        if precompiled is not None:
+            loader = ChoiceLoader([precompiled, loader])
+        context.environment = Environment(
+            loader=loader,
+            bytecode_cache=ChecksumBytecodeCache(
+                FileSystemBytecodeCache(TEMPLATE_CACHE_DIR), shared
+            ),
+            auto_reload=True,
+        )
+    return context.environment
+
+
+def load_barn_template(name):
+    # FunctionLoader hook for names like "<bucket>/<key>:html". The compiled
+    # template stays current for as long as fetch_template returns the same
+    # copy of the object
+    path, part = name.rsplit(":", 1)
+    bucket_name, template_key = path.split("/", 1)
+    template = fetch_template(bucket_name, template_key)
+    source = template.html_source if part == "html" else template.text_source
+
+    def uptodate():
+        return fetch_template(bucket_name, template_key) is template
+
+    return source, None, uptodate
+
+
+class ChecksumBytecodeCache:
+    # Wraps a Jinja bytecode cache so entries are keyed on the template source
+    # checksum as well as its name. A changed template gets a new entry rather
+    # than overwriting the old one, and unchanged ones are never recompiled.
+    # Misses fall back to the shared cache, if there is one, and anything
+    # found there is kept locally.
+    def __init__(self, cache, shared=None):
+        self.cache = cache
+        self.shared = shared
+
+    def get_bucket(self, environment, name, filename, source):
+        key = name + "#" + self.cache.get_source_checksum(source)
+        bucket = self.cache.get_bucket(environment, key, filename, source)
+        if bucket.code is None and self.shared is not None:
+            self.shared.load_bytecode(bucket)
+            if bucket.code is not None:
+                self.cache.set_bucket(bucket)
+        return bucket
+
+    def set_bucket(self, bucket):
+        self.cache.set_bucket(bucket)
+        if self.shared is not None:
+            self.shared.set_bucket(bucket)
+
+
+class PrecompiledTemplates:
+    # Loader for the modules written by precompile_templates. A precompiled
+    # template is only used while its barn object still has the ETag it was
+    # built from, otherwise Jinja falls through to load_barn_template.
+    def __init__(self, path, etags):
+        from jinja2 import ModuleLoader
+
+        self.modules = ModuleLoader(path)
+        self.etags = etags
+
+    @classmethod
+    def find(cls, path):
+        try:
+            with open(os.path.join(path, "manifest.json")) as manifest:
+                return cls(path, json.load(manifest))
+        except FileNotFoundError:
+            return None
+
+    def load(self, environment, name, globals=None):
+        from jinja2 import TemplateNotFound
+
+        path = name.rsplit(":", 1)[0]
+        if path not in self.etags:
+            raise TemplateNotFound(name)
+        bucket_name, template_key = path.split("/", 1)
+        template = fetch_template(bucket_name, template_key)
+        if template.etag != self.etags[path]:
+            raise TemplateNotFound(name)
+
+        compiled = self.modules.load(environment, name, globals)
+        compiled._uptodate = (
+            lambda: fetch_template(bucket_name, template_key) is template
         )
+        return compiled
+
+
+def precompile_templates(
+    bucket_name,
+    target=PRECOMPILED_TEMPLATES,
+    prefixes=("transactional/", "newsletters/"),
+):
+    # Build step: compiles both halves of every barn template into modules in
+    # target, next to a manifest of the ETags they were compiled from, so the
+    # packaged Lambdas never compile a template S3 hasn't changed since
+    from jinja2 import DictLoader, Environment
+
+    context = get_context()
+    sources = {}
+    etags = {}
+    paginator = context.s3.meta.client.get_paginator("list_objects_v2")
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for item in page.get("Contents", []):
+                if not item["Key"].endswith(".j2"):
+                    continue
+                template = fetch_template(bucket_name, item["Key"])
+                name = bucket_name + "/" + item["Key"]
+                sources[name + ":html"] = template.html_source
+                sources[name + ":text"] = template.text_source
+                etags[name] = template.etag
+
+    # Modules left over from templates that have since been deleted go too
+    if os.path.isdir(target):
+        for filename in os.listdir(target):
+            if filename.startswith("tmpl_"):
+                os.remove(os.path.join(target, filename))
+    environment = Environment(loader=DictLoader(sources))
+    environment.compile_templates(target, zip=None, ignore_errors=False)
+    with open(os.path.join(target, "manifest.json"), "w") as manifest:
+        json.dump(etags, manifest, indent=2, sort_keys=True)
+    return sorted(etags)
+
+
+def load_template_source(bucket_name, template_key):
+    template = fetch_template(bucket_name, template_key)
+    return template.html_source, template.text_source
+
+
+class BarnTemplate:
+    # A template from the barn as last fetched, and when S3 was last asked
+    # whether it had changed
+    def __init__(self, etag, html_source, text_source):
+        self.etag = etag
+        self.html_source = html_source
+        self.text_source = text_source
+        self.checked_at = time.monotonic()
+
+
+def fetch_template(bucket_name, template_key):
+    # Load email template from bucket, or from the warm container's cache.
+    # Once a cached copy is older than TEMPLATE_TTL it is revalidated with a
+    # conditional GET on its ETag, and kept as is if S3 says it is unchanged.
+    templates = get_context().templates
+    cached = templates.get((bucket_name, template_key))
+    if cached is not None and time.monotonic() - cached.checked_at < TEMPLATE_TTL:
+        return cached
+
+    s3 = get_context().s3
+    request = {"IfNoneMatch": cached.etag} if cached is not None else {}
+    try:
+        with timed("template_fetch"):
+            response = s3.Object(bucket_name, template_key).get(**request)
+            combined_template = response["Body"].read().decode("utf-8")
     except botocore.exceptions.ClientError as error:
+        if cached is not None and not_modified(error):
+            cached.checked_at = time.monotonic()
+            return cached
         raise Exception("Could not load template from s3 bucket", error)
 
     # Check for split point and separate HTML and text templates
@@ -415,7 +2583,76 @@ def load_template(bucket_name, template_key):
     if text_template.isspace() or not text_template:
         raise ValueError("Newsletter text template cannot be empty.")
 
-    validation_html_template = Template(html_template)
-    validation_text_template = Template(text_template)
+    template = BarnTemplate(response.get("ETag"), html_template, text_template)
+    templates[(bucket_name, template_key)] = template
+    return template
 
-    return validation_html_template, validation_text_template
+
+def not_modified(error):
+    # S3 answers a conditional GET for an unchanged object with a bare 304
+    return error.response["Error"]["Code"] in ("304", "NotModified") or (
+        error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304
+    )
+
+
+def main(argv=None):
+    # Command line for moving whole lists in and out of the users table, using
+    # the AWS credentials and MeadowDictionary of the environment it runs in
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(prog="meadow")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="add subscribers from a file")
+    importer.add_argument("path", help="CSV or JSON lines file, - for stdin")
+    importer.add_argument("--format", choices=["csv", "jsonl"])
+    importer.add_argument("--offset", type=int, default=0)
+    importer.add_argument("--concurrency", type=int, default=IMPORT_CONCURRENCY)
+    exporter = commands.add_parser("export", help="write subscribers to a file")
+    exporter.add_argument("path", help="CSV or JSON lines file, - for stdout")
+    exporter.add_argument("--format", choices=["csv", "jsonl"])
+    exporter.add_argument("--segments", type=int, default=EXPORT_SEGMENTS)
+    args = parser.parse_args(argv)
+
+    file_format = args.format
+    if file_format is None and args.path.endswith(".csv"):
+        file_format = "csv"
+
+    if args.command == "import":
+
+        def progress(summary, elapsed):
+            print(
+                "offset",
+                summary["offset"],
+                "imported",
+                summary["imported"],
+                round(summary["imported"] / elapsed, 1) if elapsed else 0.0,
+                "per second",
+                file=sys.stderr,
+            )
+
+        source = sys.stdin if args.path == "-" else open(args.path, newline="")
+        with source:
+            summary = import_subscribers(
+                source, args.offset, args.concurrency, progress, file_format
+            )
+        print(json.dumps(summary))
+        return 1 if summary["errors"] else 0
+
+    import csv
+
+    target = sys.stdout if args.path == "-" else open(args.path, "w", newline="")
+    with target:
+        if file_format == "csv":
+            rows = csv.writer(target)
+            rows.writerow(["email"])
+        for email in export_subscribers(args.segments):
+            if file_format == "csv":
+                rows.writerow([email])
+            else:
+                target.write(json.dumps({"email": email}) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
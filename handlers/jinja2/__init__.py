@@ -2,43 +2,67 @@
 """Jinja is a template engine written in pure Python. It provides a
 non-XML syntax that supports inline expressions and an optional
 sandboxed environment.
+
+The public names are imported from their modules on first access, so
+importing the package is cheap and only the parts that are used get
+loaded.
 """
-from markupsafe import escape
-from markupsafe import Markup
-
-from .bccache import BytecodeCache
-from .bccache import FileSystemBytecodeCache
-from .bccache import MemcachedBytecodeCache
-from .environment import Environment
-from .environment import Template
-from .exceptions import TemplateAssertionError
-from .exceptions import TemplateError
-from .exceptions import TemplateNotFound
-from .exceptions import TemplateRuntimeError
-from .exceptions import TemplatesNotFound
-from .exceptions import TemplateSyntaxError
-from .exceptions import UndefinedError
-from .filters import contextfilter
-from .filters import environmentfilter
-from .filters import evalcontextfilter
-from .loaders import BaseLoader
-from .loaders import ChoiceLoader
-from .loaders import DictLoader
-from .loaders import FileSystemLoader
-from .loaders import FunctionLoader
-from .loaders import ModuleLoader
-from .loaders import PackageLoader
-from .loaders import PrefixLoader
-from .runtime import ChainableUndefined
-from .runtime import DebugUndefined
-from .runtime import make_logging_undefined
-from .runtime import StrictUndefined
-from .runtime import Undefined
-from .utils import clear_caches
-from .utils import contextfunction
-from .utils import environmentfunction
-from .utils import evalcontextfunction
-from .utils import is_undefined
-from .utils import select_autoescape
+from importlib import import_module
 
 __version__ = "2.11.3"
+
+# public name -> module it is defined in
+_lazy_attributes = {
+    "escape": "markupsafe",
+    "Markup": "markupsafe",
+    "BytecodeCache": ".bccache",
+    "FileSystemBytecodeCache": ".bccache",
+    "MemcachedBytecodeCache": ".bccache",
+    "S3BytecodeCache": ".bccache",
+    "Environment": ".environment",
+    "Template": ".environment",
+    "TemplateAssertionError": ".exceptions",
+    "TemplateError": ".exceptions",
+    "TemplateNotFound": ".exceptions",
+    "TemplateRuntimeError": ".exceptions",
+    "TemplatesNotFound": ".exceptions",
+    "TemplateSyntaxError": ".exceptions",
+    "UndefinedError": ".exceptions",
+    "contextfilter": ".filters",
+    "environmentfilter": ".filters",
+    "evalcontextfilter": ".filters",
+    "BaseLoader": ".loaders",
+    "ChoiceLoader": ".loaders",
+    "DictLoader": ".loaders",
+    "FileSystemLoader": ".loaders",
+    "FunctionLoader": ".loaders",
+    "ModuleLoader": ".loaders",
+    "PackageLoader": ".loaders",
+    "PrefixLoader": ".loaders",
+    "ChainableUndefined": ".runtime",
+    "DebugUndefined": ".runtime",
+    "make_logging_undefined": ".runtime",
+    "StrictUndefined": ".runtime",
+    "Undefined": ".runtime",
+    "clear_caches": ".utils",
+    "contextfunction": ".utils",
+    "environmentfunction": ".utils",
+    "evalcontextfunction": ".utils",
+    "is_undefined": ".utils",
+    "select_autoescape": ".utils",
+}
+
+__all__ = sorted(_lazy_attributes)
+
+
+def __getattr__(name):
+    module = _lazy_attributes.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
@@ -348,3 +348,62 @@ class MemcachedBytecodeCache(BytecodeCache):
         except Exception:
             if not self.ignore_memcache_errors:
                 raise
+
+
+class S3BytecodeCache(BytecodeCache):
+    """A bytecode cache that stores bytecode in an Amazon S3 bucket, so that
+    any number of processes loading the same templates only compile them
+    once.  It accepts a boto3 S3 client, the name of the bucket and a prefix
+    added before each key.
+
+    Keys are made up of the cache key for the template and the checksum of
+    its source, so changed templates are written next to the old ones rather
+    than over them.  Entries written by another Python version are rejected
+    by the magic header and then overwritten.
+
+    S3 errors are ignored by default and treated as a cache miss, pass
+    ``ignore_s3_errors=False`` to have them raised instead.  A missing key is
+    always a miss.
+
+    This bytecode cache does not support clearing of used items in the cache,
+    use a lifecycle rule on the prefix to expire old entries.  The clear
+    method is a no-operation function.
+    """
+
+    def __init__(
+        self, client, bucket_name, prefix="jinja2/bytecode/", ignore_s3_errors=True
+    ):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.ignore_s3_errors = ignore_s3_errors
+
+    def _get_key(self, bucket):
+        return "%s%s-%s" % (self.prefix, bucket.key, bucket.checksum)
+
+    def load_bytecode(self, bucket):
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket_name, Key=self._get_key(bucket)
+            )
+            code = response["Body"].read()
+        except Exception as e:
+            error = getattr(e, "response", {}).get("Error", {})
+            if not self.ignore_s3_errors and error.get("Code") not in (
+                "NoSuchKey",
+                "404",
+            ):
+                raise
+            return
+        bucket.bytecode_from_string(code)
+
+    def dump_bytecode(self, bucket):
+        try:
+            self.client.put_object(
+                Bucket=self.bucket_name,
+                Key=self._get_key(bucket),
+                Body=bucket.bytecode_to_string(),
+            )
+        except Exception:
+            if not self.ignore_s3_errors:
+                raise
@@ -1,7 +1,5 @@
 # -*- coding: utf-8 -*-
 from ._compat import range_type
-from .filters import FILTERS as DEFAULT_FILTERS  # noqa: F401
-from .tests import TESTS as DEFAULT_TESTS  # noqa: F401
 from .utils import Cycler
 from .utils import generate_lorem_ipsum
 from .utils import Joiner
@@ -21,7 +19,21 @@ LSTRIP_BLOCKS = False
 NEWLINE_SEQUENCE = "\n"
 KEEP_TRAILING_NEWLINE = False
 
-# default filters, tests and namespace
+# default filters, tests and namespace, the filter and test tables are looked
+# up on first use so importing the defaults doesn't import those modules
+
+
+def __getattr__(name):
+    if name == "DEFAULT_FILTERS":
+        from .filters import FILTERS
+
+        return FILTERS
+    if name == "DEFAULT_TESTS":
+        from .tests import TESTS
+
+        return TESTS
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 
 DEFAULT_NAMESPACE = {
     "range": range_type,
@@ -20,16 +20,12 @@ from ._compat import PYPY
 from ._compat import reraise
 from ._compat import string_types
 from ._compat import text_type
-from .compiler import CodeGenerator
-from .compiler import generate
 from .defaults import BLOCK_END_STRING
 from .defaults import BLOCK_START_STRING
 from .defaults import COMMENT_END_STRING
 from .defaults import COMMENT_START_STRING
-from .defaults import DEFAULT_FILTERS
 from .defaults import DEFAULT_NAMESPACE
 from .defaults import DEFAULT_POLICIES
-from .defaults import DEFAULT_TESTS
 from .defaults import KEEP_TRAILING_NEWLINE
 from .defaults import LINE_COMMENT_PREFIX
 from .defaults import LINE_STATEMENT_PREFIX
@@ -43,10 +39,7 @@ from .exceptions import TemplateRuntimeError
 from .exceptions import TemplatesNotFound
 from .exceptions import TemplateSyntaxError
 from .exceptions import UndefinedError
-from .lexer import get_lexer
-from .lexer import TokenStream
 from .nodes import EvalContext
-from .parser import Parser
 from .runtime import Context
 from .runtime import new_context
 from .runtime import Undefined
@@ -138,6 +131,17 @@ def _environment_sanity_check(environment):
     return environment
 
 
+class _DefaultCodeGenerator(object):
+    """Resolves to :class:`~jinja2.compiler.CodeGenerator` when looked up, so
+    the compiler is only imported once a template is actually compiled.
+    """
+
+    def __get__(self, obj, cls=None):
+        from .compiler import CodeGenerator
+
+        return CodeGenerator
+
+
 class Environment(object):
     r"""The core component of Jinja is the `Environment`.  It contains
     important shared variables like configuration, filters, tests,
@@ -279,7 +283,7 @@ class Environment(object):
 
     #: the class that is used for code generation.  See
     #: :class:`~jinja2.compiler.CodeGenerator` for more information.
-    code_generator_class = CodeGenerator
+    code_generator_class = _DefaultCodeGenerator()
 
     #: the context class thatis used for templates.  See
     #: :class:`~jinja2.runtime.Context` for more information.
@@ -341,9 +345,9 @@ class Environment(object):
         self.finalize = finalize
         self.autoescape = autoescape
 
-        # defaults
-        self.filters = DEFAULT_FILTERS.copy()
-        self.tests = DEFAULT_TESTS.copy()
+        # defaults, the filters and tests are copied on first use
+        self._filters = None
+        self._tests = None
         self.globals = DEFAULT_NAMESPACE.copy()
 
         # set the loader provided
@@ -419,7 +423,8 @@ class Environment(object):
         del args["self"], args["cache_size"], args["extensions"]
 
         rv = object.__new__(self.__class__)
-        rv.__dict__.update(self.__dict__)
+        # the overlay shares the filter and test tables, so create them first
+        rv.__dict__.update(self.__dict__, _filters=self.filters, _tests=self.tests)
         rv.overlayed = True
         rv.linked_to = self
 
@@ -440,7 +445,43 @@ class Environment(object):
 
         return _environment_sanity_check(rv)
 
-    lexer = property(get_lexer, doc="The lexer for this environment.")
+    @property
+    def lexer(self):
+        """The lexer for this environment."""
+        from .lexer import get_lexer
+
+        return get_lexer(self)
+
+    @property
+    def filters(self):
+        """The filters available to templates.  A copy of the default
+        filters is made on first access, so the filters module is only
+        imported by environments that use it.
+        """
+        if self._filters is None:
+            from .filters import FILTERS
+
+            self._filters = FILTERS.copy()
+        return self._filters
+
+    @filters.setter
+    def filters(self, value):
+        self._filters = value
+
+    @property
+    def tests(self):
+        """The tests available to templates, copied from the default tests
+        on first access like :attr:`filters`.
+        """
+        if self._tests is None:
+            from .tests import TESTS
+
+            self._tests = TESTS.copy()
+        return self._tests
+
+    @tests.setter
+    def tests(self, value):
+        self._tests = value
 
     def iter_extensions(self):
         """Iterates over the extensions by priority."""
@@ -536,6 +577,8 @@ class Environment(object):
 
     def _parse(self, source, name, filename):
         """Internal parsing function used by `parse` and `compile`."""
+        from .parser import Parser
+
         return Parser(self, source, name, encode_filename(filename)).parse()
 
     def lex(self, source, name=None, filename=None):
@@ -569,6 +612,8 @@ class Environment(object):
         """Called by the parser to do the preprocessing and filtering
         for all the extensions.  Returns a :class:`~jinja2.lexer.TokenStream`.
         """
+        from .lexer import TokenStream
+
         source = self.preprocess(source, name, filename)
         stream = self.lexer.tokenize(source, name, filename, state)
         for ext in self.iter_extensions():
@@ -583,6 +628,8 @@ class Environment(object):
 
         .. versionadded:: 2.5
         """
+        from .compiler import generate
+
         return generate(
             source,
             self,
@@ -665,6 +712,8 @@ class Environment(object):
 
         .. versionadded:: 2.1
         """
+        from .parser import Parser
+
         parser = Parser(self, source, state="variable")
         try:
             expr = parser.parse_expression()
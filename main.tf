@@ -20,6 +20,11 @@ resource "aws_dynamodb_table" "members" {
     type = "S"
   }
 
+  attribute {
+    name = "subscribed_shard"
+    type = "S"
+  }
+
   global_secondary_index {
     name = "is_subscribed"
     hash_key = "is_subscribed"
@@ -28,6 +33,17 @@ resource "aws_dynamodb_table" "members" {
     read_capacity = 1
     write_capacity = 1
   }
+
+  // Sparse index of subscribers only, spread over SUBSCRIBED#<n> keys so no
+  // one key is hot and newsletter shards can query it in parallel
+  global_secondary_index {
+    name = "subscribed_shard"
+    hash_key = "subscribed_shard"
+    projection_type = "INCLUDE"
+    non_key_attributes = [ "partitionKey" ]
+    read_capacity = 1
+    write_capacity = 1
+  }
 }
 
 // Configure domain certificate
@@ -107,7 +123,10 @@ resource "aws_ssm_parameter" "members" {
   "website_domain": "${var.website_domain}",
   "region": "${var.region}",
   "barn": "${aws_s3_bucket.barn.id}",
-  "honeypot_secret": "${var.honeypot_secret}"
+  "template_cache": "jinja2/bytecode/",
+  "honeypot_secret": "${var.honeypot_secret}",
+  "unsubscribe_secret": "${var.unsubscribe_secret}",
+  "subscriber_shards": ${var.subscriber_shards}
 }
 EOF
 }
@@ -0,0 +1,160 @@
+"""Import-time benchmark for the handlers.
+
+Runs each endpoint's imports in a fresh interpreter under ``python -X
+importtime`` and reports what they cost, so a module that starts pulling in
+something heavy at cold start shows up here. Each endpoint's cold start is
+then timed through ``initialise()``, against a stubbed SSM, along with the AWS
+clients it builds. Run with ``make import-benchmark`` or directly::
+
+    python tests/benchmark/import_time.py --runs 10 --budget validate=150
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HANDLERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../handlers")
+
+# What each endpoint imports before it first talks to AWS. The API endpoints
+# only need the handler module itself; send_validation_email and
+# send_newsletter go on to build the template environment and the rest of
+# their lazy imports.
+ENDPOINTS = {
+    "signup": "import handler",
+    "validate": "import handler",
+    "unsubscribe": "import handler",
+    "send_validation_email": "import handler; handler.template_environment()",
+    "send_newsletter": (
+        "import handler; handler.template_environment();"
+        " handler.compile_newsletter_template('{{ unsubscribe_path }}');"
+        " list(handler.map_bounded(len, [], 2));"
+        " import boto3.dynamodb.conditions"
+    ),
+}
+
+# Loads the MeadowDictionary from a stubbed SSM, so that initialise() runs
+# without AWS, and reports how long the cold start took and what it connected to
+INITIALISE = """
+import json, time
+import botocore.stub
+started = time.perf_counter()
+%s
+stubber = botocore.stub.Stubber(handler.get_context().client("ssm"))
+stubber.add_response("get_parameter", {"Parameter": {"Value": %r}})
+stubber.activate()
+handler.initialise()
+context = handler.get_context()
+print(json.dumps({
+    "ms": (time.perf_counter() - started) * 1000,
+    "services": sorted(set(context.clients) | set(context.resources)),
+}))
+"""
+
+MEADOW = {"table": "meadow-users", "barn": "my-barn", "region": "us-east-1"}
+
+
+def parse(output):
+    # Lines look like "import time:  self [us] | cumulative | imported package",
+    # with the package indented to show what imported it
+    modules = {}
+    prefix = len("import time:")
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[prefix:].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        modules[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return modules
+
+
+def run(arguments):
+    with tempfile.TemporaryDirectory() as cache:
+        environment = dict(os.environ, TEMPLATE_CACHE_DIR=cache)
+        environment.setdefault("AWS_DEFAULT_REGION", MEADOW["region"])
+        return subprocess.run(
+            [sys.executable] + arguments,
+            cwd=HANDLERS,
+            env=environment,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+
+
+def measure(code):
+    # Imports done by code in a fresh interpreter, as {module: (self, cumulative)}
+    # in microseconds
+    return parse(run(["-X", "importtime", "-c", code]).stderr)
+
+
+def cold_start(code):
+    # Milliseconds for code and then initialise() in a fresh interpreter, and
+    # the AWS services it created clients or resources for
+    result = json.loads(run(["-c", INITIALISE % (code, json.dumps(MEADOW))]).stdout)
+    return result["ms"], result["services"]
+
+
+def benchmark(runs):
+    # Median total import time in milliseconds and the modules from the last run,
+    # then the median cold start through initialise() and the services it used
+    baseline = statistics.median(
+        sum(own for own, _ in measure("pass").values()) for _ in range(runs)
+    )
+    results = {}
+    for endpoint, code in ENDPOINTS.items():
+        totals = []
+        for _ in range(runs):
+            modules = measure(code)
+            totals.append(sum(own for own, _ in modules.values()))
+        starts = [cold_start(code) for _ in range(runs)]
+        results[endpoint] = (
+            (statistics.median(totals) - baseline) / 1000,
+            modules,
+            statistics.median(ms for ms, _ in starts),
+            starts[-1][1],
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        metavar="ENDPOINT=MS",
+        help="fail if the endpoint's median import time goes over MS",
+    )
+    args = parser.parse_args()
+    budgets = {
+        endpoint: float(ms)
+        for endpoint, ms in (budget.split("=") for budget in args.budget)
+    }
+
+    over = []
+    for endpoint, (total, modules, started, services) in benchmark(args.runs).items():
+        print("%-16s %8.1f ms  %4d modules" % (endpoint, total, len(modules)))
+        print("    %-24s %8.1f ms  %s" % ("initialise()", started, ", ".join(services)))
+        heaviest = sorted(
+            (name for name in modules if "." not in name),
+            key=lambda name: modules[name][1],
+            reverse=True,
+        )
+        for name in heaviest[: args.top]:
+            print("    %-24s %8.1f ms" % (name, modules[name][1] / 1000))
+        if endpoint in budgets and total > budgets[endpoint]:
+            over.append(endpoint)
+
+    if over:
+        sys.exit("Over import time budget: " + ", ".join(over))
+
+
+if __name__ == "__main__":
+    main()
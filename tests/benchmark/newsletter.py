@@ -0,0 +1,356 @@
+"""End-to-end benchmark for send_newsletter.
+
+Sends a newsletter to a stand-in users table of any size through a stand-in
+SES, both in memory with configurable latency, and reports recipients per
+second, wall time and peak RSS. Save a run with ``--save`` and compare later
+ones against it with ``--baseline``. Run from the repository root with ``make
+newsletter-benchmark`` or, so the handler finds its vendored Jinja::
+
+    PYTHONPATH=handlers python -m tests.benchmark.newsletter --ses-latency 20
+"""
+import argparse
+import collections
+import contextlib
+import io
+import json
+import resource
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+import botocore.exceptions
+
+from handlers import handler
+
+TEMPLATE = (
+    "<html><body>\n"
+    + "<p>{{ 'Meadow' }} newsletter paragraph, long enough to be typical.</p>\n" * 40
+    + '<p><a href="{{ unsubscribe_path }}">Unsubscribe</a></p>\n</body></html>\n'
+    + "---TEXT-HTML-SEPARATOR---\n"
+    + "Meadow newsletter paragraph, long enough to be typical.\n" * 40
+    + "Unsubscribe: {{ unsubscribe_path }}\n"
+)
+
+MEADOW = {
+    "organisation": "Meadow Benchmark",
+    "table": "meadow-users",
+    "meadow_domain": "meadow.test",
+    "website_domain": "test",
+    "region": "us-east-1",
+    "honeypot_secret": "11111111",
+    "barn": "my-barn",
+}
+
+
+def condition_value(condition):
+    # The attribute and value of a boto3 Key(...).eq(...) or Attr(...).eq(...)
+    attribute, value = condition.get_expression()["values"]
+    return attribute.name, value
+
+
+class StandInTable:
+    # In-memory users table covering the calls a newsletter send makes, each
+    # taking latency seconds. Index queries are answered from a sorted list
+    # built on first use, so paging through 100k subscribers stays cheap.
+    def __init__(self, latency=0.0, name="meadow-users"):
+        self.name = name
+        self.latency = latency
+        self.items = {}
+        self.indexes = {}
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+        self.meta = SimpleNamespace(client=StandInTableClient(self))
+
+    def call(self, operation):
+        with self.lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_item(self, Key, **kwargs):
+        self.call("get_item")
+        item = self.items.get((Key["partitionKey"], Key["sortKey"]))
+        return {} if item is None else {"Item": dict(item)}
+
+    def put_item(self, Item, ConditionExpression=None):
+        self.call("put_item")
+        key = (Item["partitionKey"], Item["sortKey"])
+        with self.lock:
+            if ConditionExpression and key in self.items:
+                raise botocore.exceptions.ClientError(
+                    {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+                )
+            self.items[key] = dict(Item)
+
+    def index(self, attribute, value):
+        with self.lock:
+            if (attribute, value) not in self.indexes:
+                keys = sorted(
+                    key
+                    for key, item in self.items.items()
+                    if item.get(attribute) == value
+                )
+                positions = {key: position for position, key in enumerate(keys)}
+                self.indexes[(attribute, value)] = (keys, positions)
+            return self.indexes[(attribute, value)]
+
+    def page(
+        self, keys, positions, index_key, Limit=None, ExclusiveStartKey=None, **kwargs
+    ):
+        # Items and LastEvaluatedKey both hold the table and index keys, like
+        # the subscriber projections
+        start = 0
+        if ExclusiveStartKey:
+            key = (ExclusiveStartKey["partitionKey"], ExclusiveStartKey["sortKey"])
+            start = positions[key] + 1
+        end = len(keys) if Limit is None else min(start + Limit, len(keys))
+        items = [
+            dict(index_key, partitionKey=key[0], sortKey=key[1])
+            for key in keys[start:end]
+        ]
+        page = {"Items": items}
+        if end < len(keys):
+            page["LastEvaluatedKey"] = items[-1]
+        return page
+
+    def query(self, KeyConditionExpression, **kwargs):
+        self.call("query")
+        attribute, value = condition_value(KeyConditionExpression)
+        keys, positions = self.index(attribute, value)
+        return self.page(keys, positions, {attribute: value}, **kwargs)
+
+    def scan(self, Segment, TotalSegments, FilterExpression, **kwargs):
+        self.call("scan")
+        attribute, value = condition_value(FilterExpression)
+        keys, positions = self.index(attribute, value)
+        keys = [
+            key
+            for key in keys
+            if zlib.crc32(key[0].encode()) % TotalSegments == Segment
+        ]
+        positions = {key: position for position, key in enumerate(keys)}
+        return self.page(keys, positions, {attribute: value}, **kwargs)
+
+
+class StandInTableClient:
+    # The table's low-level client, for the batch calls
+    def __init__(self, table):
+        self.table = table
+
+    def batch_write_item(self, RequestItems):
+        self.table.call("batch_write_item")
+        for request in RequestItems[self.table.name]:
+            item = request["PutRequest"]["Item"]
+            with self.table.lock:
+                self.table.items[(item["partitionKey"], item["sortKey"])] = item
+        return {"UnprocessedItems": {}}
+
+    def batch_get_item(self, RequestItems):
+        self.table.call("batch_get_item")
+        items = []
+        for key in RequestItems[self.table.name]["Keys"]:
+            item = self.table.items.get((key["partitionKey"], key["sortKey"]))
+            if item is not None:
+                items.append({"partitionKey": item["partitionKey"]})
+        return {"Responses": {self.table.name: items}, "UnprocessedKeys": {}}
+
+
+class StandInSes:
+    # Records how many calls and messages it was sent, each call taking
+    # latency seconds. Message bodies are dropped so they don't count
+    # towards peak RSS.
+    def __init__(self, latency=0.0, send_rate=1000000.0):
+        self.latency = latency
+        self.quota = {
+            "Max24HourSend": 1000000000.0,
+            "MaxSendRate": send_rate,
+            "SentLast24Hours": 0.0,
+        }
+        self.calls = collections.Counter()
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    def call(self, operation, messages=0):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[operation] += 1
+            self.messages += messages
+
+    def get_send_quota(self):
+        return dict(self.quota)
+
+    def send_email(self, **kwargs):
+        self.call("send_email", 1)
+        return {"MessageId": "benchmark"}
+
+    def send_bulk_templated_email(self, Destinations, **kwargs):
+        self.call("send_bulk_templated_email", len(Destinations))
+        return {"Status": [{"Status": "Success"} for _ in Destinations]}
+
+    def create_template(self, Template):
+        self.call("create_template")
+
+    def update_template(self, Template):
+        self.call("update_template")
+
+
+class StandInS3:
+    # Serves the one newsletter template from the barn
+    def __init__(self, template=TEMPLATE):
+        self.body = template.encode("utf-8")
+
+    def Object(self, bucket_name, key):
+        def get(**kwargs):
+            return {"Body": io.BytesIO(self.body), "ETag": '"benchmark"'}
+
+        return SimpleNamespace(get=get)
+
+
+def build_table(subscribers, latency=0.0, subscriber_shards=0):
+    table = StandInTable(latency)
+    for number in range(subscribers):
+        email = "subscriber%07d@example.com" % number
+        item = {
+            "partitionKey": email,
+            "sortKey": "NEWSLETTER_SIGNUP",
+            "random_string": "BENCHMARK",
+            "is_subscribed": "true",
+        }
+        if subscriber_shards:
+            item["subscribed_shard"] = handler.subscriber_shard(
+                email, subscriber_shards
+            )
+        table.items[(email, "NEWSLETTER_SIGNUP")] = item
+    return table
+
+
+@contextlib.contextmanager
+def installed(table, ses, s3, meadow):
+    # Point the warm container state at the stand-ins, loaded for good so SSM
+    # is never asked for the MeadowDictionary, and put it back afterwards
+    context = handler.get_context()
+    ttl, cache_dir = context.ttl, handler.TEMPLATE_CACHE_DIR
+    context.invalidate()
+    context.ttl = float("inf")
+    context.meadow = meadow
+    context.loaded_at = time.monotonic()
+    context.table = table
+    context.ses = ses
+    context.s3 = s3
+    try:
+        with tempfile.TemporaryDirectory() as cache:
+            handler.TEMPLATE_CACHE_DIR = cache
+            yield
+    finally:
+        context.invalidate()
+        context.ttl, handler.TEMPLATE_CACHE_DIR = ttl, cache_dir
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run(
+    subscribers,
+    ses_latency=0.0,
+    dynamodb_latency=0.0,
+    send_rate=1000000.0,
+    subscriber_shards=0,
+    signed=False,
+    **options,
+):
+    # Send one newsletter to a fresh stand-in table and return what it took.
+    # options are passed through in the send_newsletter event, e.g.
+    # concurrency, page_size, bulk and batch_writes
+    meadow = dict(MEADOW, subscriber_shards=subscriber_shards)
+    if signed:
+        meadow["unsubscribe_secret"] = "benchmark-secret"
+    table = build_table(subscribers, dynamodb_latency, subscriber_shards)
+    ses = StandInSes(ses_latency, send_rate)
+    event = dict(
+        newsletter_slug="benchmark",
+        newsletter_subject="Meadow Benchmark",
+        **{name: value for name, value in options.items() if value is not None},
+    )
+
+    rss_before = peak_rss_mb()
+    output = io.StringIO()
+    with installed(table, ses, StandInS3(), meadow):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            response = handler.send_newsletter(event, None)
+        wall = time.perf_counter() - started
+
+    metrics = {}
+    for line in output.getvalue().splitlines():
+        if line.startswith('{"_aws"'):
+            metrics = json.loads(line)
+            del metrics["_aws"]
+    return {
+        "subscribers": subscribers,
+        "sent": response["sent"],
+        "failed": response["failed"],
+        "wall_seconds": round(wall, 3),
+        "recipients_per_second": round(response["sent"] / wall, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_before_send_mb": round(rss_before, 1),
+        "ses_calls": sum(ses.calls.values()),
+        "dynamodb_calls": sum(table.calls.values()),
+        "metrics": metrics,
+    }
+
+
+def compare(result, baseline):
+    # Ratio of each headline number to the baseline's
+    return {
+        name: round(result[name] / baseline[name], 3) if baseline[name] else None
+        for name in ("recipients_per_second", "wall_seconds", "peak_rss_mb")
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=100000)
+    parser.add_argument("--ses-latency", type=float, default=0.0, help="ms")
+    parser.add_argument("--dynamodb-latency", type=float, default=0.0, help="ms")
+    parser.add_argument("--send-rate", type=float, default=1000000.0)
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--page-size", type=int)
+    parser.add_argument("--bulk", action="store_true", default=None)
+    parser.add_argument("--batch-writes", action="store_true", default=None)
+    parser.add_argument("--signed", action="store_true")
+    parser.add_argument("--subscriber-shards", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with results saved earlier")
+    args = parser.parse_args(argv)
+
+    result = run(
+        args.subscribers,
+        ses_latency=args.ses_latency / 1000,
+        dynamodb_latency=args.dynamodb_latency / 1000,
+        send_rate=args.send_rate,
+        subscriber_shards=args.subscriber_shards,
+        signed=args.signed,
+        concurrency=args.concurrency,
+        page_size=args.page_size,
+        bulk=args.bulk,
+        batch_writes=args.batch_writes,
+    )
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            result["against_baseline"] = compare(result, json.load(baseline))
+    if args.save:
+        with open(args.save, "w") as saved:
+            json.dump(result, saved, indent=2)
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Microbenchmark for random_string generation.
+
+Compares TokenGenerator with the random.choices join it replaced, one token
+at a time and in newsletter-sized batches. Run from the repository root with
+``make token-benchmark`` or::
+
+    python -m tests.benchmark.tokens --number 20000
+"""
+import argparse
+import random
+import string
+import timeit
+
+from handlers.handler import TOKEN_LENGTH, TokenGenerator
+
+
+def random_choices_token():
+    # How random_string used to be made
+    return "".join(random.choices(string.ascii_uppercase + string.digits, k=32))
+
+
+def benchmark(number, batch):
+    # Best time per token in microseconds, for each way of making them
+    generator = TokenGenerator()
+    cases = [
+        ("random.choices", random_choices_token, 1),
+        ("TokenGenerator.token", generator.token, 1),
+        (
+            "random.choices x%d" % batch,
+            lambda: [random_choices_token() for _ in range(batch)],
+            batch,
+        ),
+        ("TokenGenerator.tokens(%d)" % batch, lambda: generator.tokens(batch), batch),
+    ]
+    results = {}
+    for name, case, per_call in cases:
+        calls = max(number // per_call, 1)
+        best = min(timeit.repeat(case, number=calls, repeat=5))
+        results[name] = best / (calls * per_call) * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    print("%d character tokens, best of 5" % TOKEN_LENGTH)
+    for name, microseconds in benchmark(args.number, args.batch).items():
+        print("%-28s %8.3f us/token" % (name, microseconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
+import threading
+
 import boto3
+import botocore
 import pytest
 from moto import mock_dynamodb2, mock_s3, mock_ses, mock_ssm
 
+from handlers.handler import get_context, invalidate_context
+
 # Refactor the fixtures in this class to avoid code duplication
 
 
@@ -304,6 +309,97 @@ def initialiseWithoutSes():
     mocks3.stop()
 
 
+@pytest.fixture(scope="function")
+def initialiseWithFakeSes(initialise):
+    # Swap the handler's SES client for a local fake that records every call
+    ddb, ssm, ses, s3 = initialise
+    fake_ses = FakeSes()
+    get_context().load()
+    get_context().ses = fake_ses
+
+    yield ddb, ssm, fake_ses, s3
+
+
+@pytest.fixture(scope="function")
+def fakeSes():
+    return FakeSes()
+
+
+class FakeSes:
+    # Stand-in for the SES client covering the calls Meadow makes
+    def __init__(self):
+        self.calls = []
+        self.templates = {}
+        # Recipients whose sends are rejected
+        self.fail_for = set()
+        # Calls to throttle before letting sends through
+        self.throttle = 0
+        self.quota = {
+            "Max24HourSend": 50000.0,
+            "MaxSendRate": 1000.0,
+            "SentLast24Hours": 0.0,
+        }
+        self.lock = threading.Lock()
+
+    def get_send_quota(self):
+        self.calls.append(("get_send_quota", {}))
+        return dict(self.quota)
+
+    def throttled(self):
+        with self.lock:
+            if not self.throttle:
+                return False
+            self.throttle -= 1
+        return True
+
+    def send_email(self, **kwargs):
+        recipient = kwargs["Destination"]["ToAddresses"][0]
+        if self.throttled():
+            raise botocore.exceptions.ClientError(
+                {
+                    "Error": {
+                        "Code": "Throttling",
+                        "Message": "Maximum sending rate exceeded.",
+                    }
+                },
+                "SendEmail",
+            )
+        if recipient in self.fail_for:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "MessageRejected", "Message": recipient}},
+                "SendEmail",
+            )
+        with self.lock:
+            self.calls.append(("send_email", kwargs))
+            return {"MessageId": str(len(self.calls))}
+
+    def create_template(self, Template):
+        self.calls.append(("create_template", Template))
+        if Template["TemplateName"] in self.templates:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "AlreadyExists", "Message": "Exists"}},
+                "CreateTemplate",
+            )
+        self.templates[Template["TemplateName"]] = Template
+
+    def update_template(self, Template):
+        self.calls.append(("update_template", Template))
+        self.templates[Template["TemplateName"]] = Template
+
+    def send_bulk_templated_email(self, **kwargs):
+        with self.lock:
+            self.calls.append(("send_bulk_templated_email", kwargs))
+        return {
+            "Status": [
+                {"Status": "Success", "MessageId": str(n)}
+                for n, _ in enumerate(kwargs["Destinations"])
+            ]
+        }
+
+    def sent(self, operation):
+        return [kwargs for name, kwargs in self.calls if name == operation]
+
+
 def baseInitialise(mockdynamodb2, mockssm, mockses, mocks3):
     # Start endpoints
     mockdynamodb2.start()
@@ -311,6 +407,8 @@ def baseInitialise(mockdynamodb2, mockssm, mockses, mocks3):
     mockses.start()
     mocks3.start()
     boto3.setup_default_session()
+    # Warm container state must not leak between tests
+    invalidate_context()
 
     # Create mock verified SES users
     ses = boto3.client("ses", region_name="us-east-1")
@@ -352,6 +450,7 @@ def mockDynamoDBTable():
             {"AttributeName": "partitionKey", "AttributeType": "S"},
             {"AttributeName": "sortKey", "AttributeType": "S"},
             {"AttributeName": "is_subscribed", "AttributeType": "S"},
+            {"AttributeName": "subscribed_shard", "AttributeType": "S"},
         ],
         TableName="meadow-users",
         KeySchema=[
@@ -381,6 +480,22 @@ def mockDynamoDBTable():
                     "WriteCapacityUnits": 1,
                 },
             },
+            {
+                "IndexName": "subscribed_shard",
+                "KeySchema": [
+                    {"AttributeName": "subscribed_shard", "KeyType": "HASH"},
+                ],
+                "Projection": {
+                    "ProjectionType": "INCLUDE",
+                    "NonKeyAttributes": [
+                        "partitionKey",
+                    ],
+                },
+                "ProvisionedThroughput": {
+                    "ReadCapacityUnits": 1,
+                    "WriteCapacityUnits": 1,
+                },
+            },
         ],
         ProvisionedThroughput={"ReadCapacityUnits": 1, "WriteCapacityUnits": 1},
     )
@@ -0,0 +1,74 @@
+from jinja2 import Environment, Template
+
+from handlers.handler import SplicedTemplate, compile_newsletter_template
+
+UNSUBSCRIBE_URL = (
+    "https://meadow.test/unsubscribe?email=dGVzdEB0ZXN0LnRlc3Q="
+    "&random_string=12345678&email_sent=20210421000000"
+)
+
+
+def test_compile_newsletter_template_splices_plain_links():
+    source = "Hello {{ name }}!\nLeave: {{ unsubscribe_path }}\n{{ unsubscribe_path }}"
+    template = compile_newsletter_template(source)
+    assert isinstance(template, SplicedTemplate)
+    assert len(template.segments) == 3
+    assert template.render(unsubscribe_path=UNSUBSCRIBE_URL) == Template(source).render(
+        unsubscribe_path=UNSUBSCRIBE_URL
+    )
+
+
+def test_compile_newsletter_template_splices_links_in_loops():
+    source = "{% for n in range(2) %}[{{ unsubscribe_path }}]{% endfor %}"
+    template = compile_newsletter_template(source)
+    assert isinstance(template, SplicedTemplate)
+    assert template.render(unsubscribe_path="x") == "[x][x]"
+
+
+def test_compile_newsletter_template_renders_filtered_links():
+    source = "Leave: {{ unsubscribe_path|upper }}"
+    template = compile_newsletter_template(source)
+    assert not isinstance(template, SplicedTemplate)
+    assert template.render(unsubscribe_path="x") == "Leave: X"
+
+
+def test_compile_newsletter_template_renders_conditional_links():
+    source = "{% if unsubscribe_path %}Leave: {{ unsubscribe_path }}{% endif %}"
+    template = compile_newsletter_template(source)
+    assert not isinstance(template, SplicedTemplate)
+    assert template.render(unsubscribe_path="") == ""
+
+
+def test_compile_newsletter_template_renders_links_in_filter_blocks():
+    source = "Leave: {% filter upper %}{{ unsubscribe_path }}{% endfilter %}"
+    template = compile_newsletter_template(source)
+    assert not isinstance(template, SplicedTemplate)
+    assert template.render(unsubscribe_path="x") == "Leave: X"
+
+
+def test_compile_newsletter_template_renders_links_in_autoescape_blocks():
+    source = "{% autoescape true %}{{ unsubscribe_path }}{% endautoescape %}"
+    template = compile_newsletter_template(source)
+    assert not isinstance(template, SplicedTemplate)
+    assert template.render(unsubscribe_path="a&b") == "a&amp;b"
+
+
+def test_compile_newsletter_template_checks_the_splice():
+    # Plain where it is written, but filtered where the block is called
+    source = (
+        "{{ self.link()|upper }}{% block link %}{{ unsubscribe_path }}{% endblock %}"
+    )
+    template = compile_newsletter_template(source)
+    assert not isinstance(template, SplicedTemplate)
+    assert template.render(unsubscribe_path="x") == "Xx"
+
+
+def test_spliced_template_escapes_like_jinja():
+    environment = Environment(autoescape=True)
+    source = '<a href="{{ unsubscribe_path }}">Unsubscribe</a>'
+    template = environment.from_string(source)
+    segments = template.render(unsubscribe_path="|").split("|")
+    spliced = SplicedTemplate(template, segments)
+    assert spliced.render(unsubscribe_path=UNSUBSCRIBE_URL) == template.render(
+        unsubscribe_path=UNSUBSCRIBE_URL
+    )
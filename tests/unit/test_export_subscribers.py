@@ -0,0 +1,99 @@
+import json
+import threading
+import zlib
+
+from handlers import handler
+from handlers.handler import export_subscribers, get_context, main
+
+
+def signup_record(email, is_subscribed) -> dict:
+    return {
+        "partitionKey": {"S": email},
+        "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+        "random_string": {"S": "12345678"},
+        "is_subscribed": {"S": is_subscribed},
+    }
+
+
+class SegmentedTable:
+    # moto ignores Segment/TotalSegments, so split its scans the way DynamoDB
+    # would: every item lands in exactly one segment
+    def __init__(self, table):
+        self.table = table
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def scan(self, Segment, TotalSegments, **kwargs):
+        page = self.table.scan(**kwargs)
+        page["Items"] = [
+            item
+            for item in page["Items"]
+            if zlib.crc32(item["partitionKey"].encode()) % TotalSegments == Segment
+        ]
+        return page
+
+
+def test_export_subscribers_reads_every_segment(initialise):
+    ddb = initialise[0]
+    emails = ["reader" + str(n) + "@test.test" for n in range(12)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email, "true"))
+    ddb.put_item(
+        TableName="meadow-users", Item=signup_record("gone@test.test", "false")
+    )
+    get_context().load()
+    get_context().table = SegmentedTable(get_context().table)
+    exported = list(export_subscribers(segments=3, page_size=5))
+    assert sorted(exported) == sorted(emails)
+
+
+def test_export_subscribers_stops_when_abandoned(initialise):
+    ddb = initialise[0]
+    emails = ["reader" + str(n) + "@test.test" for n in range(30)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email, "true"))
+    get_context().load()
+    get_context().table = SegmentedTable(get_context().table)
+    exported = export_subscribers(segments=2, page_size=1)
+    assert next(exported) in emails
+    # The readers fill the queue long before running out of pages
+    closing = threading.Thread(target=exported.close)
+    closing.start()
+    closing.join(timeout=10)
+    assert not closing.is_alive()
+
+
+def test_export_subscribers_sharded(initialise):
+    ddb, ssm = initialise[0], initialise[1]
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = dict(json.loads(parameter["Value"]), subscriber_shards=4)
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+    emails = ["reader" + str(n) + "@test.test" for n in range(12)]
+    for email in emails:
+        record = signup_record(email, "true")
+        del record["is_subscribed"]
+        record["subscribed_shard"] = {"S": handler.subscriber_shard(email, 4)}
+        ddb.put_item(TableName="meadow-users", Item=record)
+    ddb.put_item(
+        TableName="meadow-users", Item=signup_record("gone@test.test", "false")
+    )
+    get_context().load()
+    get_context().table = SegmentedTable(get_context().table)
+    exported = list(export_subscribers(segments=3, page_size=5))
+    assert sorted(exported) == sorted(emails)
+
+
+def test_export_subscribers_command_line(initialise, tmp_path):
+    ddb = initialise[0]
+    ddb.put_item(
+        TableName="meadow-users", Item=signup_record("reader@test.test", "true")
+    )
+    path = tmp_path / "subscribers.csv"
+    assert main(["export", str(path), "--segments", "1"]) == 0
+    assert path.read_text().splitlines() == ["email", "reader@test.test"]
@@ -0,0 +1,108 @@
+import io
+import json
+
+from handlers.handler import import_subscribers, main, subscriber_shard
+
+
+def signup_record(email, is_subscribed) -> dict:
+    return {
+        "partitionKey": {"S": email},
+        "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+        "random_string": {"S": "12345678"},
+        "is_subscribed": {"S": is_subscribed},
+    }
+
+
+def signup(ddb, email):
+    return ddb.get_item(
+        TableName="meadow-users",
+        Key={"partitionKey": {"S": email}, "sortKey": {"S": "NEWSLETTER_SIGNUP"}},
+        ConsistentRead=True,
+    ).get("Item")
+
+
+def use_subscriber_shards(ssm, shards):
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = json.loads(parameter["Value"])
+    meadow["subscriber_shards"] = shards
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+
+
+def csv_file(emails):
+    return io.StringIO("name,email\n" + "".join("x," + e + "\n" for e in emails))
+
+
+def test_import_subscribers_from_csv(initialise):
+    ddb = initialise[0]
+    emails = ["reader" + str(n) + "@test.test" for n in range(120)]
+    response = import_subscribers(csv_file(emails + ["not-an-email"]))
+    assert response["imported"] == 120
+    assert response["invalid"] == 1
+    assert response["offset"] == 121
+    assert response["errors"] == []
+    for email in emails:
+        assert signup(ddb, email)["is_subscribed"]["S"] == "true"
+
+
+def test_import_subscribers_from_json_lines(initialise):
+    ddb = initialise[0]
+    lines = [json.dumps({"email": "reader@test.test"}) + "\n", "\n"]
+    assert import_subscribers(lines)["imported"] == 1
+    assert signup(ddb, "reader@test.test")["is_subscribed"]["S"] == "true"
+
+
+def test_import_subscribers_counts_malformed_json_lines(initialise):
+    ddb = initialise[0]
+    lines = [
+        json.dumps({"email": "reader@test.test"}) + "\n",
+        '{"email": "broken@test.test"\n',
+        json.dumps(["list@test.test"]) + "\n",
+        json.dumps({"email": 42}) + "\n",
+    ]
+    response = import_subscribers(lines)
+    assert response["imported"] == 1
+    assert response["invalid"] == 3
+    assert response["offset"] == 4
+    assert signup(ddb, "reader@test.test") is not None
+
+
+def test_import_subscribers_sharded(initialise):
+    ddb, ssm = initialise[0], initialise[1]
+    use_subscriber_shards(ssm, 4)
+    assert import_subscribers(csv_file(["reader@test.test"]))["imported"] == 1
+    record = signup(ddb, "reader@test.test")
+    assert "is_subscribed" not in record
+    assert record["subscribed_shard"]["S"] == subscriber_shard("reader@test.test", 4)
+
+
+def test_import_subscribers_leaves_existing_alone(initialise):
+    ddb = initialise[0]
+    ddb.put_item(
+        TableName="meadow-users", Item=signup_record("gone@test.test", "false")
+    )
+    response = import_subscribers(csv_file(["gone@test.test", "new@test.test"]))
+    assert response["imported"] == 1
+    assert response["existing"] == 1
+    assert signup(ddb, "gone@test.test")["is_subscribed"]["S"] == "false"
+
+
+def test_import_subscribers_resumes_from_offset(initialise):
+    ddb = initialise[0]
+    emails = ["reader" + str(n) + "@test.test" for n in range(5)]
+    response = import_subscribers(csv_file(emails), offset=3)
+    assert response["imported"] == 2
+    assert response["offset"] == 5
+    assert signup(ddb, emails[2]) is None
+    assert signup(ddb, emails[3]) is not None
+
+
+def test_import_subscribers_command_line(initialise, tmp_path, capsys):
+    path = tmp_path / "subscribers.csv"
+    path.write_text("email\nreader@test.test\n")
+    assert main(["import", str(path)]) == 0
+    assert json.loads(capsys.readouterr().out)["imported"] == 1
@@ -0,0 +1,43 @@
+import pytest
+
+from tests.benchmark.import_time import ENDPOINTS, cold_start, measure, parse
+
+
+@pytest.mark.parametrize("endpoint", ["signup", "validate", "unsubscribe"])
+def test_endpoint_does_not_import_templating(endpoint):
+    modules = measure(ENDPOINTS[endpoint])
+    assert "handler" in modules
+    assert "jinja2" not in modules
+    assert "markupsafe" not in modules
+    assert "boto3.dynamodb.conditions" not in modules
+
+
+@pytest.mark.parametrize("endpoint", ["signup", "validate", "unsubscribe"])
+def test_endpoint_cold_start_only_connects_to_what_it_uses(endpoint):
+    ms, services = cold_start(ENDPOINTS[endpoint])
+    assert services == ["dynamodb", "ssm"]
+
+
+def test_send_validation_email_imports_templating_on_first_use():
+    modules = measure(ENDPOINTS["send_validation_email"])
+    assert "jinja2" in modules
+    assert "jinja2" not in measure("import handler")
+
+
+def test_parse_importtime_output():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   _weakref\n"
+        "import time:      1500 |       1620 | handler\n"
+        "Traceback noise\n"
+    )
+    assert parse(output) == {"_weakref": (120, 120), "handler": (1500, 1620)}
+
+
+def test_jinja_imports_modules_on_first_use():
+    assert "jinja2.environment" not in measure("import jinja2")
+    # Loading precompiled or cached templates never needs the compiler
+    modules = measure("import jinja2; jinja2.Environment()")
+    for module in ("jinja2.lexer", "jinja2.compiler", "jinja2.filters"):
+        assert module not in modules
+    assert "jinja2.lexer" in measure("import jinja2; jinja2.Template('{{ x }}')")
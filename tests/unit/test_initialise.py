@@ -0,0 +1,61 @@
+import json
+
+from handlers import handler
+
+
+def update_meadow_dictionary(ssm, **changes):
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = json.loads(parameter["Value"])
+    meadow.update(changes)
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+
+
+def test_initialise_happy_path(initialise):
+    logger, meadow, table = handler.initialise()
+    assert meadow["organisation"] == "Meadow Testing"
+    assert table.name == "meadow-users"
+
+
+def test_initialise_reuses_warm_context(initialise):
+    ssm = initialise[1]
+    first = handler.initialise()
+    update_meadow_dictionary(ssm, organisation="Changed")
+    second = handler.initialise()
+    # Warm invocations must not go back to SSM inside the TTL
+    assert second[1]["organisation"] == "Meadow Testing"
+    assert second[2] is first[2]
+
+
+def test_initialise_refreshes_after_ttl(initialise):
+    ssm = initialise[1]
+    handler.initialise()
+    update_meadow_dictionary(ssm, organisation="Changed")
+    handler.get_context().loaded_at -= handler.get_context().ttl + 1
+    logger, meadow, table = handler.initialise()
+    assert meadow["organisation"] == "Changed"
+
+
+def test_initialise_invalidate_forces_reload(initialise):
+    ssm = initialise[1]
+    first = handler.initialise()
+    update_meadow_dictionary(ssm, organisation="Changed")
+    handler.invalidate_context()
+    second = handler.initialise()
+    assert second[1]["organisation"] == "Changed"
+    assert second[2] is not first[2]
+
+
+def test_initialise_shares_configured_clients(initialise):
+    handler.initialise()
+    context = handler.get_context()
+    assert context.ses is context.client("ses")
+    assert context.client("lambda") is context.client("lambda")
+    for client in (context.ses, context.ssm, context.table.meta.client):
+        assert client.meta.config.retries["mode"] == "adaptive"
+        assert client.meta.config.max_pool_connections >= handler.SEND_CONCURRENCY
+        assert client.meta.config.max_pool_connections == handler.MAX_SEND_CONCURRENCY
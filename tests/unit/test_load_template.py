@@ -0,0 +1,132 @@
+import pytest
+
+from handlers import handler
+from handlers.handler import get_context, invalidate_context, load_template
+
+TEMPLATE_KEY = ("my-barn", "transactional/validate.j2")
+
+
+def expire_cached_template():
+    get_context().templates[TEMPLATE_KEY].checked_at -= 3600
+
+
+@pytest.fixture(autouse=True)
+def templateCacheDir(tmp_path, monkeypatch):
+    monkeypatch.setattr(handler, "TEMPLATE_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_load_template_happy_path(initialise):
+    get_context().load()
+    html_template, text_template = load_template(*TEMPLATE_KEY)
+    assert "https://x" in html_template.render(unsubscribe_path="https://x")
+
+
+def test_load_template_is_cached(initialise):
+    get_context().load()
+    first = load_template(*TEMPLATE_KEY)
+    second = load_template(*TEMPLATE_KEY)
+    assert second[0] is first[0]
+    assert second[1] is first[1]
+
+
+def test_load_template_revalidates_without_recompiling(initialise):
+    get_context().load()
+    first = load_template(*TEMPLATE_KEY)
+    expire_cached_template()
+    # S3 answers 304 for the unchanged object, so nothing is recompiled
+    second = load_template(*TEMPLATE_KEY)
+    assert second[0] is first[0]
+
+
+def test_load_template_picks_up_changed_template(initialise):
+    s3 = initialise[3]
+    get_context().load()
+    first = load_template(*TEMPLATE_KEY)
+    s3.put_object(
+        Body="New {{ unsubscribe_path }}\n---TEXT-HTML-SEPARATOR---\nNew".encode(
+            "utf-8"
+        ),
+        Bucket="my-barn",
+        Key="transactional/validate.j2",
+    )
+    # Still cached until the TTL runs out
+    assert load_template(*TEMPLATE_KEY)[0] is first[0]
+    expire_cached_template()
+    html_template, text_template = load_template(*TEMPLATE_KEY)
+    assert html_template is not first[0]
+    assert html_template.render(unsubscribe_path="x").startswith("New x")
+
+
+def test_load_template_writes_bytecode_cache(initialise, templateCacheDir):
+    get_context().load()
+    load_template(*TEMPLATE_KEY)
+    # One entry each for the html and text halves
+    assert len(list(templateCacheDir.iterdir())) == 2
+
+
+def test_load_template_reuses_bytecode_cache(initialise, templateCacheDir):
+    get_context().load()
+    first = load_template(*TEMPLATE_KEY)
+    cached = sorted(path.stat().st_mtime_ns for path in templateCacheDir.iterdir())
+    # A fresh environment finds the bytecode already in the cache directory
+    invalidate_context()
+    get_context().load()
+    second = load_template(*TEMPLATE_KEY)
+    assert second[0] is not first[0]
+    assert second[0].render(unsubscribe_path="x") == first[0].render(
+        unsubscribe_path="x"
+    )
+    assert (
+        sorted(path.stat().st_mtime_ns for path in templateCacheDir.iterdir()) == cached
+    )
+
+
+def use_shared_template_cache(ssm):
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=(
+            '{ "organisation": "Meadow Testing","table": "meadow-users", '
+            '"meadow_domain": "meadow.test", "website_domain": "test", '
+            '"region": "us-east-1", "honeypot_secret": "11111111", '
+            '"barn": "my-barn", "template_cache": "jinja2/bytecode/" }'
+        ),
+        Type="String",
+        Overwrite=True,
+    )
+
+
+def test_load_template_shares_bytecode_through_barn(initialise, templateCacheDir):
+    ssm, s3 = initialise[1], initialise[3]
+    use_shared_template_cache(ssm)
+    get_context().load()
+    load_template(*TEMPLATE_KEY)
+    shared = s3.list_objects_v2(Bucket="my-barn", Prefix="jinja2/bytecode/")
+    assert len(shared["Contents"]) == 2
+
+
+def test_load_template_cold_start_uses_shared_bytecode(
+    initialise, templateCacheDir, monkeypatch
+):
+    ssm = initialise[1]
+    use_shared_template_cache(ssm)
+    get_context().load()
+    first = load_template(*TEMPLATE_KEY)
+
+    # A new container has nothing in /tmp but finds the bytecode in the barn
+    invalidate_context()
+    get_context().load()
+    for path in templateCacheDir.iterdir():
+        path.unlink()
+    environment = handler.template_environment()
+
+    def compile(*args, **kwargs):
+        raise AssertionError("template was recompiled")
+
+    monkeypatch.setattr(environment, "compile", compile)
+    second = load_template(*TEMPLATE_KEY)
+    assert second[0].render(unsubscribe_path="x") == first[0].render(
+        unsubscribe_path="x"
+    )
+    # and keeps a local copy
+    assert len(list(templateCacheDir.iterdir())) == 2
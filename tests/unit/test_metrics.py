@@ -0,0 +1,114 @@
+import binascii
+import json
+
+import pytest
+
+from handlers import handler
+from handlers.handler import InvocationMetrics, instrumented, percentile
+
+
+class Clock:
+    # Moves on a fixed number of seconds every time it is read
+    def __init__(self, step):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def metric_lines(capsys):
+    lines = capsys.readouterr().out.splitlines()
+    return [json.loads(line) for line in lines if line.startswith('{"_aws"')]
+
+
+def test_invocation_metrics_embedded_metric_format():
+    metrics = InvocationMetrics("send_newsletter", clock=Clock(0.5))
+    with metrics.time("render"):
+        pass
+    with metrics.time("render"):
+        pass
+    metrics.count("sends", 2)
+    line = metrics.as_dict()
+    [directive] = line["_aws"]["CloudWatchMetrics"]
+    assert directive["Dimensions"] == [["function"]]
+    units = {metric["Name"]: metric["Unit"] for metric in directive["Metrics"]}
+    assert units["render"] == "Milliseconds"
+    assert units["sends"] == "Count"
+    assert line["function"] == "send_newsletter"
+    assert line["render"] == 1000
+    assert line["sends"] == 2
+    assert line["failures"] == 0
+    assert line["retries"] == 0
+
+
+def test_invocation_metrics_percentiles():
+    metrics = InvocationMetrics("send_newsletter", clock=Clock(0.001))
+    metrics.record("render", 5.0)
+    metrics.keep_samples()
+    for milliseconds in range(1, 101):
+        metrics.record("render", float(milliseconds))
+    stages = metrics.percentiles()
+    assert stages == {"render": {"count": 100, "p50": 50, "p95": 95, "p99": 99}}
+    assert percentile([7.0], 0.99) == 7.0
+
+
+def test_instrumented_logs_one_line_per_invocation(initialise, capsys):
+    @instrumented
+    def inner(event, context):
+        handler.get_context().metrics.count("sends")
+
+    @instrumented
+    def outer(event, context):
+        inner(event, context)
+        inner(event, context)
+
+    outer({}, None)
+    [line] = metric_lines(capsys)
+    assert line["function"] == "outer"
+    assert line["sends"] == 2
+    assert handler.get_context().metrics is None
+
+
+def test_instrumented_logs_failed_invocations(initialise, capsys):
+    with pytest.raises(binascii.Error):
+        handler.unsubscribe({"queryStringParameters": {"email": "abc"}}, None)
+    [line] = metric_lines(capsys)
+    assert line["function"] == "unsubscribe"
+    assert "ssm_load" in line
+
+
+def test_validate_cannot_decode_email(initialise):
+    with pytest.raises(binascii.Error):
+        handler.validate({"queryStringParameters": {"email": "abc"}}, None)
+
+
+def test_send_newsletter_metrics(initialiseWithFakeSes, capsys):
+    ddb, ses = initialiseWithFakeSes[0], initialiseWithFakeSes[2]
+    for email in ["reader@test.test", "bounce@test.test"]:
+        ddb.put_item(
+            TableName="meadow-users",
+            Item={
+                "partitionKey": {"S": email},
+                "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+                "random_string": {"S": "12345678"},
+                "is_subscribed": {"S": "true"},
+            },
+        )
+    ses.fail_for.add("bounce@test.test")
+    ses.throttle = 1
+    handler.send_newsletter(
+        {
+            "newsletter_slug": "20210421",
+            "newsletter_subject": "Meadow Testing Newsletter",
+        },
+        None,
+    )
+    [line] = metric_lines(capsys)
+    assert line["sends"] == 1
+    assert line["failures"] == 1
+    assert line["retries"] == 1
+    for timing in ["template_fetch", "template_compile", "render", "send"]:
+        assert line[timing] >= 0
+    assert line["dynamodb_calls"] > 0
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from handlers import handler
+from handlers.handler import migrate_subscribers, subscriber_shard
+
+
+def signup_record(email, is_subscribed=None) -> dict:
+    record = {
+        "partitionKey": {"S": email},
+        "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+        "random_string": {"S": "12345678"},
+    }
+    if is_subscribed is not None:
+        record["is_subscribed"] = {"S": is_subscribed}
+    return record
+
+
+def use_subscriber_shards(ssm, shards):
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = json.loads(parameter["Value"])
+    meadow["subscriber_shards"] = shards
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+
+
+def signup(ddb, email):
+    return ddb.get_item(
+        TableName="meadow-users",
+        Key={"partitionKey": {"S": email}, "sortKey": {"S": "NEWSLETTER_SIGNUP"}},
+        ConsistentRead=True,
+    )["Item"]
+
+
+@pytest.fixture(scope="function")
+def initialiseSubscribers(initialise, fakeSes):
+    ddb, ssm = initialise[0], initialise[1]
+    use_subscriber_shards(ssm, 4)
+    subscribed = ["reader" + str(n) + "@test.test" for n in range(10)]
+    for email in subscribed:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email, "true"))
+    ddb.put_item(
+        TableName="meadow-users", Item=signup_record("gone@test.test", "false")
+    )
+    ddb.put_item(TableName="meadow-users", Item=signup_record("new@test.test"))
+    handler.get_context().load()
+    handler.get_context().ses = fakeSes
+
+    yield ddb, ssm, fakeSes, subscribed
+
+
+def test_migrate_subscribers_shards_and_sparsifies(initialiseSubscribers):
+    ddb, ssm, ses, subscribed = initialiseSubscribers
+    response = migrate_subscribers({"page_size": 3}, None)
+    assert response["subscribed"] == len(subscribed)
+    assert response["unsubscribed"] == 1
+    assert response["start_key"] is None
+    for email in subscribed:
+        assert signup(ddb, email)["subscribed_shard"]["S"] == subscriber_shard(email, 4)
+        assert "is_subscribed" not in signup(ddb, email)
+    assert "is_subscribed" not in signup(ddb, "gone@test.test")
+    assert "subscribed_shard" not in signup(ddb, "new@test.test")
+
+
+def test_migrate_subscribers_is_safe_to_rerun(initialiseSubscribers):
+    subscribed = initialiseSubscribers[3]
+    migrate_subscribers({}, None)
+    response = migrate_subscribers({}, None)
+    assert response["subscribed"] == 0
+    assert response["unsubscribed"] == 0
+    assert response["unchanged"] == len(subscribed) + 2
+
+
+def test_migrate_subscribers_moves_to_new_shard_count(initialiseSubscribers):
+    ddb, ssm, ses, subscribed = initialiseSubscribers
+    migrate_subscribers({}, None)
+    migrate_subscribers({"shards": 7}, None)
+    for email in subscribed:
+        assert signup(ddb, email)["subscribed_shard"]["S"] == subscriber_shard(email, 7)
+
+
+def test_migrate_subscribers_needs_shards(initialise):
+    with pytest.raises(ValueError, match="subscriber_shards"):
+        migrate_subscribers({}, None)
+
+
+def test_send_newsletter_reads_every_shard(initialiseSubscribers):
+    ddb, ssm, ses, subscribed = initialiseSubscribers
+    migrate_subscribers({}, None)
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "page_size": 2,
+    }
+    assert handler.send_newsletter(event, None)["sent"] == len(subscribed)
+    recipients = [
+        call["Destination"]["ToAddresses"][0] for call in ses.sent("send_email")
+    ]
+    assert sorted(recipients) == sorted(subscribed)
@@ -0,0 +1,31 @@
+from handlers.handler import get_context
+from tests.benchmark.newsletter import compare, run
+
+
+def test_benchmark_sends_to_every_subscriber():
+    ttl = get_context().ttl
+    result = run(300, concurrency=4, page_size=50)
+    assert result["sent"] == 300
+    assert result["failed"] == 0
+    assert result["recipients_per_second"] > 0
+    assert result["ses_calls"] == 300
+    assert result["metrics"]["sends"] == 300
+    # The warm container state is put back for the tests that follow
+    assert get_context().ttl == ttl
+    assert get_context().table is None
+
+
+def test_benchmark_bulk_and_sharded_sends():
+    assert run(300, bulk=True, page_size=50)["sent"] == 300
+    assert run(300, subscriber_shards=3, page_size=50)["sent"] == 300
+    assert run(300, signed=True, batch_writes=True)["dynamodb_calls"] < 300
+
+
+def test_compare_with_baseline():
+    result = {"recipients_per_second": 150.0, "wall_seconds": 2.0, "peak_rss_mb": 0}
+    baseline = {"recipients_per_second": 100.0, "wall_seconds": 4.0, "peak_rss_mb": 0}
+    assert compare(result, baseline) == {
+        "recipients_per_second": 1.5,
+        "wall_seconds": 0.5,
+        "peak_rss_mb": None,
+    }
@@ -0,0 +1,69 @@
+import pytest
+
+from handlers import handler
+from handlers.handler import load_template, precompile_templates
+
+TEMPLATE_KEY = ("my-barn", "transactional/validate.j2")
+
+
+@pytest.fixture(autouse=True)
+def templateDirs(tmp_path, monkeypatch):
+    precompiled = tmp_path / "precompiled"
+    monkeypatch.setattr(handler, "PRECOMPILED_TEMPLATES", str(precompiled))
+    monkeypatch.setattr(handler, "TEMPLATE_CACHE_DIR", str(tmp_path / "cache"))
+    return precompiled
+
+
+def cold_start(monkeypatch):
+    # A fresh container that fails the test if it compiles anything
+    handler.invalidate_context()
+    handler.get_context().load()
+    environment = handler.template_environment()
+
+    def compile(*args, **kwargs):
+        raise AssertionError("template was recompiled")
+
+    monkeypatch.setattr(environment, "compile", compile)
+    return environment
+
+
+def test_precompile_templates_writes_modules(initialise, templateDirs):
+    built = precompile_templates("my-barn", str(templateDirs))
+    assert built == [
+        "my-barn/newsletters/20210421.j2",
+        "my-barn/transactional/validate.j2",
+    ]
+    # An html and a text module for each template, plus the manifest
+    assert len(list(templateDirs.glob("tmpl_*.py"))) == 4
+    assert (templateDirs / "manifest.json").exists()
+
+
+def test_load_template_uses_precompiled_modules(initialise, templateDirs, monkeypatch):
+    precompile_templates("my-barn", str(templateDirs))
+    cold_start(monkeypatch)
+    html_template, text_template = load_template(*TEMPLATE_KEY)
+    assert "https://x" in html_template.render(unsubscribe_path="https://x")
+    assert "https://x" in text_template.render(unsubscribe_path="https://x")
+
+
+def test_load_template_compiles_changed_template(initialise, templateDirs):
+    s3 = initialise[3]
+    precompile_templates("my-barn", str(templateDirs))
+    s3.put_object(
+        Body="New {{ unsubscribe_path }}\n---TEXT-HTML-SEPARATOR---\nNew".encode(
+            "utf-8"
+        ),
+        Bucket="my-barn",
+        Key="transactional/validate.j2",
+    )
+    handler.invalidate_context()
+    handler.get_context().load()
+    # The precompiled module is out of date, so S3 wins
+    html_template, text_template = load_template(*TEMPLATE_KEY)
+    assert html_template.render(unsubscribe_path="x").startswith("New x")
+
+
+def test_load_template_without_precompiled_modules(initialise, templateDirs):
+    handler.get_context().load()
+    html_template, text_template = load_template(*TEMPLATE_KEY)
+    assert "https://x" in html_template.render(unsubscribe_path="https://x")
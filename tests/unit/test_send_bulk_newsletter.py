@@ -0,0 +1,123 @@
+import json
+
+from handlers import handler
+from handlers.handler import is_plain_substitution, send_newsletter
+
+
+def signup_record(email) -> dict:
+    return {
+        "partitionKey": {"S": email},
+        "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+        "random_string": {"S": "12345678"},
+        "is_subscribed": {"S": "true"},
+    }
+
+
+def bulk_event() -> dict:
+    return {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "bulk": True,
+    }
+
+
+def add_subscribers(ddb, count):
+    emails = ["reader" + str(n) + "@test.test" for n in range(count)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    return emails
+
+
+def test_send_bulk_newsletter_happy_path(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    emails = add_subscribers(ddb, 3)
+    send_newsletter(bulk_event(), None)
+
+    template = ses.templates["meadow-20210421"]
+    assert "{{{unsubscribe_path}}}" in template["HtmlPart"]
+    assert "{{{unsubscribe_path}}}" in template["TextPart"]
+    assert ses.sent("send_email") == []
+
+    [bulk] = ses.sent("send_bulk_templated_email")
+    assert bulk["Template"] == "meadow-20210421"
+    assert sorted(
+        destination["Destination"]["ToAddresses"][0]
+        for destination in bulk["Destinations"]
+    ) == sorted(emails)
+    for destination in bulk["Destinations"]:
+        data = json.loads(destination["ReplacementTemplateData"])
+        assert "/unsubscribe?email=" in data["unsubscribe_path"]
+
+
+def test_send_bulk_newsletter_batches_destinations(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    add_subscribers(ddb, 120)
+    send_newsletter(bulk_event(), None)
+    batches = ses.sent("send_bulk_templated_email")
+    assert [len(batch["Destinations"]) for batch in batches] == [50, 50, 20]
+
+
+def test_send_bulk_newsletter_trims_batches_to_daily_quota(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    emails = add_subscribers(ddb, 60)
+    ses.quota = {"Max24HourSend": 100.0, "MaxSendRate": 100.0, "SentLast24Hours": 70.0}
+    event = dict(bulk_event(), concurrency=1)
+    first = send_newsletter(event, None)
+    assert first["sent"] == 30
+    assert first["failed"] == 0
+    assert first["complete"] is False
+
+    ses.quota["SentLast24Hours"] = 0.0
+    second = send_newsletter(event, None)
+    assert second["sent"] == 30
+    assert second["complete"] is True
+    recipients = [
+        destination["Destination"]["ToAddresses"][0]
+        for batch in ses.sent("send_bulk_templated_email")
+        for destination in batch["Destinations"]
+    ]
+    assert sorted(recipients) == sorted(emails)
+
+
+def test_send_bulk_newsletter_updates_existing_template(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    add_subscribers(ddb, 1)
+    send_newsletter(bulk_event(), None)
+    send_newsletter(dict(bulk_event(), restart=True), None)
+    assert len(ses.sent("update_template")) == 1
+
+
+def test_send_bulk_newsletter_falls_back_to_single_sends(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    add_subscribers(ddb, 2)
+    s3.put_object(
+        Body="Hi {{ unsubscribe_path|upper }}\n---TEXT-HTML-SEPARATOR---\nHi".encode(
+            "utf-8"
+        ),
+        Bucket="my-barn",
+        Key="newsletters/20210421.j2",
+    )
+    send_newsletter(bulk_event(), None)
+    assert ses.sent("send_bulk_templated_email") == []
+    assert len(ses.sent("send_email")) == 2
+
+
+def test_is_plain_substitution():
+    assert is_plain_substitution("{{ unsubscribe_path }}", "unsubscribe_path")
+    assert is_plain_substitution("no link here", "unsubscribe_path")
+    assert not is_plain_substitution("{{ unsubscribe_path|upper }}", "unsubscribe_path")
+    assert not is_plain_substitution(
+        "{% if unsubscribe_path %}{{ unsubscribe_path }}{% endif %}",
+        "unsubscribe_path",
+    )
+    assert not is_plain_substitution(
+        "{% filter upper %}{{ unsubscribe_path }}{% endfilter %}",
+        "unsubscribe_path",
+    )
+
+
+def test_ses_template_part_renders_filtered_blocks_per_recipient():
+    plain = "{{ unsubscribe_path }}"
+    filtered = "{% filter upper %}{{ unsubscribe_path }}{% endfilter %}"
+    assert handler.ses_template_part(plain) == "{{{unsubscribe_path}}}"
+    assert handler.ses_template_part(filtered) is None
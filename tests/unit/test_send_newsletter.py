@@ -1,6 +1,10 @@
+import json
+import pstats
+
 import pytest
 
-from handlers.handler import send_newsletter
+from handlers import handler
+from handlers.handler import get_context, send_newsletter
 
 
 def subscriber_record() -> dict:
@@ -12,13 +16,47 @@ def subscriber_record() -> dict:
     }
 
 
+def signup_record(email, is_subscribed="true") -> dict:
+    return {
+        "partitionKey": {"S": email},
+        "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+        "random_string": {"S": "12345678"},
+        "is_subscribed": {"S": is_subscribed},
+    }
+
+
+def sent_records(ddb, email):
+    return ddb.query(
+        TableName="meadow-users",
+        KeyConditionExpression="partitionKey = :email AND begins_with(sortKey, :sent)",
+        ExpressionAttributeValues={
+            ":email": {"S": email},
+            ":sent": {"S": "EMAIL_SENT#"},
+        },
+    )["Items"]
+
+
+class LambdaContext:
+    # Runs out of time after a given number of deadline checks
+    invoked_function_arn = None
+
+    def __init__(self, checks):
+        self.checks = checks
+
+    def get_remaining_time_in_millis(self):
+        self.checks -= 1
+        return 60000 if self.checks > 0 else 1000
+
+
 def test_send_newsletter_happy_path(initialise):
     event = {
         "newsletter_slug": "20210421",
         "newsletter_subject": "Meadow Testing Newsletter",
     }
     response = send_newsletter(event, None)
-    assert response == 0
+    assert response["sent"] == 0
+    assert response["failed"] == 0
+    assert response["errors"] == []
 
 
 def test_send_newsletter_cannot_load_slug_details_from_event(initialise):
@@ -117,4 +155,343 @@ def test_send_newsletter_email_send_fails_without_raising_error(initialiseWithou
     }
     # Send fails but we expect no exception to be raised, only logged.
     response = send_newsletter(event, None)
-    assert response == 0
+    assert response["sent"] + response["failed"] == 1
+
+
+def test_send_newsletter_follows_every_subscriber_page(initialiseWithFakeSes):
+    ddb = initialiseWithFakeSes[0]
+    emails = ["reader" + str(n) + "@test.test" for n in range(5)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    ddb.put_item(
+        TableName="meadow-users", Item=signup_record("gone@test.test", "false")
+    )
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "page_size": 2,
+    }
+    send_newsletter(event, None)
+    for email in emails:
+        assert len(sent_records(ddb, email)) == 1
+    assert sent_records(ddb, "gone@test.test") == []
+
+
+def test_iter_subscriber_pages_is_lazy_and_projected(initialise):
+    ddb = initialise[0]
+    for n in range(3):
+        ddb.put_item(
+            TableName="meadow-users", Item=signup_record(str(n) + "@test.test")
+        )
+    get_context().load()
+    pages = handler.iter_subscriber_pages(get_context().table, page_size=1)
+    [first], next_key = next(pages)
+    assert set(first) == {"partitionKey", "sortKey", "is_subscribed"}
+    assert next_key is not None
+    assert sum(len(items) for items, _ in pages) == 2
+
+
+def test_send_newsletter_batches_sent_records(initialiseWithFakeSes):
+    ddb = initialiseWithFakeSes[0]
+    emails = ["reader" + str(n) + "@test.test" for n in range(30)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "batch_writes": True,
+    }
+    assert send_newsletter(event, None)["unwritten_records"] == 0
+    for email in emails:
+        assert len(sent_records(ddb, email)) == 1
+
+
+def test_send_newsletter_concurrently_reports_errors_in_order(
+    initialiseWithFakeSes, monkeypatch
+):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    emails = ["reader" + str(n) + "@test.test" for n in range(20)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    ses.fail_for = {"reader3@test.test", "reader14@test.test", "reader7@test.test"}
+
+    # DynamoDB doesn't promise any order within an index key, so note the
+    # order subscribers were actually read in
+    table = get_context().table
+    query = table.query
+    read = []
+
+    def recording_query(**kwargs):
+        page = query(**kwargs)
+        read.extend(item["partitionKey"] for item in page["Items"])
+        return page
+
+    monkeypatch.setattr(table, "query", recording_query)
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "concurrency": 4,
+    }
+    response = send_newsletter(event, None)
+    assert response["sent"] == 17
+    assert response["failed"] == 3
+    # Errors follow the order subscribers were read from the index
+    failed = [error["email"] for error in response["errors"]]
+    assert sorted(read) == sorted(emails)
+    assert failed == [email for email in read if email in ses.fail_for]
+    assert len(ses.sent("send_email")) == 17
+
+
+def test_send_newsletter_concurrency_fits_connection_pool(
+    initialiseWithFakeSes, monkeypatch
+):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    for n in range(3):
+        email = "reader" + str(n) + "@test.test"
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    map_bounded = handler.map_bounded
+    used = []
+
+    def recording_map_bounded(function, items, concurrency):
+        used.append(concurrency)
+        return map_bounded(function, items, concurrency)
+
+    monkeypatch.setattr(handler, "map_bounded", recording_map_bounded)
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "concurrency": handler.MAX_SEND_CONCURRENCY * 10,
+    }
+    assert send_newsletter(event, None)["sent"] == 3
+    assert used == [handler.MAX_SEND_CONCURRENCY]
+
+
+def test_send_newsletter_retries_throttled_sends(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    ddb.put_item(TableName="meadow-users", Item=signup_record("test@test.test"))
+    ses.throttle = 2
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+    }
+    response = send_newsletter(event, None)
+    assert response["sent"] == 1
+    assert len(ses.sent("send_email")) == 1
+
+
+def test_send_newsletter_stops_when_daily_quota_runs_out(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    for n in range(5):
+        ddb.put_item(
+            TableName="meadow-users", Item=signup_record(str(n) + "@test.test")
+        )
+    ses.quota = {"Max24HourSend": 10.0, "MaxSendRate": 100.0, "SentLast24Hours": 7.0}
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "concurrency": 1,
+    }
+    response = send_newsletter(event, None)
+    assert response["sent"] == 3
+    assert response["remaining_quota"] == 0
+    assert response["quota_exhausted"] is True
+    assert len(ses.sent("send_email")) == 3
+
+
+def test_send_newsletter_resumes_after_daily_quota_runs_out(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    emails = ["reader" + str(n) + "@test.test" for n in range(10)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    ses.quota = {"Max24HourSend": 10.0, "MaxSendRate": 100.0, "SentLast24Hours": 7.0}
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "concurrency": 4,
+    }
+    first = send_newsletter(event, None)
+    # Recipients the quota turned away are not sent yet, rather than failed
+    assert first["failed"] == 0
+    assert first["complete"] is False
+
+    ses.quota["SentLast24Hours"] = 0.0
+    second = send_newsletter(event, None)
+    assert second["complete"] is True
+    assert second["total_failed"] == 0
+    recipients = [
+        call["Destination"]["ToAddresses"][0] for call in ses.sent("send_email")
+    ]
+    assert sorted(recipients) == sorted(emails)
+
+
+def test_send_newsletter_resumes_after_running_out_of_time(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    emails = ["reader" + str(n) + "@test.test" for n in range(7)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "page_size": 2,
+        "concurrency": 1,
+    }
+    first = send_newsletter(event, LambdaContext(4))
+    assert first["complete"] is False
+    assert 0 < first["sent"] < 7
+
+    second = send_newsletter(event, None)
+    assert second["complete"] is True
+    assert second["email_sent_date"] == first["email_sent_date"]
+    assert second["total_sent"] == 7
+    # Nobody is sent the newsletter twice
+    assert len(ses.sent("send_email")) == 7
+    for email in emails:
+        assert len(sent_records(ddb, email)) == 1
+
+
+def test_send_newsletter_skips_recipients_sent_before_checkpoint(
+    initialiseWithFakeSes,
+):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    for email in ["a@test.test", "b@test.test"]:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    # A previous run reached a@test.test but stopped before checkpointing
+    ddb.put_item(
+        TableName="meadow-users",
+        Item={
+            "partitionKey": {"S": "CAMPAIGN#20210421"},
+            "sortKey": {"S": "CAMPAIGN"},
+            "email_sent_date": {"S": "20210421000000"},
+            "status": {"S": "sending"},
+            "sent": {"N": "1"},
+            "failed": {"N": "0"},
+        },
+    )
+    ddb.put_item(
+        TableName="meadow-users",
+        Item={
+            "partitionKey": {"S": "a@test.test"},
+            "sortKey": {"S": "EMAIL_SENT#20210421000000"},
+            "random_string": {"S": "12345678"},
+        },
+    )
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+    }
+    response = send_newsletter(event, None)
+    assert response["sent"] == 1
+    assert response["total_sent"] == 2
+    [sent] = ses.sent("send_email")
+    assert sent["Destination"]["ToAddresses"] == ["b@test.test"]
+
+
+def test_send_newsletter_is_not_resent_unless_restarted(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    ddb.put_item(TableName="meadow-users", Item=signup_record("test@test.test"))
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+    }
+    send_newsletter(event, None)
+    again = send_newsletter(event, None)
+    assert again["sent"] == 0
+    assert again["complete"] is True
+    assert len(ses.sent("send_email")) == 1
+
+    send_newsletter(dict(event, restart=True), None)
+    assert len(ses.sent("send_email")) == 2
+
+
+def use_signed_links(ssm, fakeSes):
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = json.loads(parameter["Value"])
+    meadow["unsubscribe_secret"] = "unsubscribe-secret"
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+    get_context().load()
+    get_context().ses = fakeSes
+
+
+def test_send_newsletter_signed_links_skip_sent_records(initialise, fakeSes):
+    ddb, ssm = initialise[0], initialise[1]
+    ddb.put_item(TableName="meadow-users", Item=signup_record("reader@test.test"))
+    use_signed_links(ssm, fakeSes)
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+    }
+    response = send_newsletter(event, None)
+    assert response["sent"] == 1
+    assert sent_records(ddb, "reader@test.test") == []
+    sent = [kwargs for name, kwargs in fakeSes.calls if name == "send_email"]
+    assert "signature=" in sent[0]["Message"]["Body"]["Html"]["Data"]
+
+
+def test_send_newsletter_signed_links_resume_mid_page(initialise, fakeSes):
+    ddb, ssm = initialise[0], initialise[1]
+    emails = ["reader" + str(n) + "@test.test" for n in range(7)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    use_signed_links(ssm, fakeSes)
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "page_size": 4,
+        "concurrency": 1,
+    }
+    # Runs out of time two subscribers into the first page
+    first = send_newsletter(event, LambdaContext(3))
+    assert first["complete"] is False
+    assert first["sent"] == 2
+
+    second = send_newsletter(event, None)
+    assert second["complete"] is True
+    assert second["total_sent"] == 7
+    # With no EMAIL_SENT records to check, only the checkpoint stops resends
+    recipients = [
+        kwargs["Destination"]["ToAddresses"][0]
+        for name, kwargs in fakeSes.calls
+        if name == "send_email"
+    ]
+    assert sorted(recipients) == sorted(emails)
+
+
+def test_send_newsletter_profile(initialiseWithFakeSes, tmp_path, monkeypatch):
+    monkeypatch.setattr(handler, "PROFILE_DIR", str(tmp_path))
+    ddb = initialiseWithFakeSes[0]
+    emails = ["reader" + str(n) + "@test.test" for n in range(5)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "profile": True,
+    }
+    profile = send_newsletter(event, None)["profile"]
+    for stage in ["render", "send"]:
+        assert profile["stages"][stage]["count"] == len(emails)
+        assert set(profile["stages"][stage]) == {"count", "p50", "p95", "p99"}
+    [stages_path, stats_path] = profile["files"]
+    assert json.load(open(stages_path)) == profile["stages"]
+    functions = {function for _, _, function in pstats.Stats(stats_path).stats}
+    assert "send_to_subscriber" in functions
+    assert "s3_keys" not in profile
+
+
+def test_send_newsletter_profile_to_barn(initialiseWithFakeSes, tmp_path, monkeypatch):
+    monkeypatch.setattr(handler, "PROFILE_DIR", str(tmp_path))
+    s3 = initialiseWithFakeSes[3]
+    event = {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "profile": "s3",
+    }
+    profile = send_newsletter(event, None)["profile"]
+    for key in profile["s3_keys"]:
+        assert key.startswith("profiles/20210421-")
+        s3.head_object(Bucket="my-barn", Key=key)
@@ -0,0 +1,179 @@
+import json
+import zlib
+
+import pytest
+
+from handlers import handler
+from handlers.handler import send_newsletter, send_newsletter_shard
+
+
+def signup_record(email) -> dict:
+    return {
+        "partitionKey": {"S": email},
+        "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+        "random_string": {"S": "12345678"},
+        "is_subscribed": {"S": "true"},
+    }
+
+
+class SegmentedTable:
+    # moto ignores Segment/TotalSegments, so split its scans the way DynamoDB
+    # would: every item lands in exactly one segment
+    def __init__(self, table):
+        self.table = table
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def scan(self, Segment, TotalSegments, **kwargs):
+        page = self.table.scan(**kwargs)
+        page["Items"] = [
+            item
+            for item in page["Items"]
+            if zlib.crc32(item["partitionKey"].encode()) % TotalSegments == Segment
+        ]
+        return page
+
+
+@pytest.fixture(scope="function")
+def initialiseShards(initialiseWithFakeSes):
+    ddb, ssm, ses, s3 = initialiseWithFakeSes
+    context = handler.get_context()
+    context.table = SegmentedTable(context.table)
+    emails = ["reader" + str(n) + "@test.test" for n in range(12)]
+    for email in emails:
+        ddb.put_item(TableName="meadow-users", Item=signup_record(email))
+
+    yield ddb, ses, emails
+
+
+def coordinator_event() -> dict:
+    return {
+        "newsletter_slug": "20210421",
+        "newsletter_subject": "Meadow Testing Newsletter",
+        "shards": 3,
+        "page_size": 2,
+    }
+
+
+def test_send_newsletter_coordinator_emits_shards(initialiseShards):
+    response = send_newsletter(coordinator_event(), None)
+    assert [shard["segment"] for shard in response["shards"]] == [0, 1, 2]
+    for shard in response["shards"]:
+        assert shard["total_segments"] == 3
+        assert shard["email_sent_date"] == response["email_sent_date"]
+        assert shard["page_size"] == 2
+        assert "shards" not in shard
+
+
+def test_send_newsletter_shards_reach_every_subscriber_once(initialiseShards):
+    ddb, ses, emails = initialiseShards
+    response = send_newsletter(coordinator_event(), None)
+    sent = sum(
+        send_newsletter_shard(shard, None)["sent"] for shard in response["shards"]
+    )
+    assert sent == len(emails)
+    recipients = [
+        call["Destination"]["ToAddresses"][0] for call in ses.sent("send_email")
+    ]
+    assert sorted(recipients) == sorted(emails)
+
+
+def test_send_newsletter_shard_is_not_resent(initialiseShards):
+    ddb, ses, emails = initialiseShards
+    [shard, *_] = send_newsletter(coordinator_event(), None)["shards"]
+    first = send_newsletter_shard(shard, None)
+    again = send_newsletter_shard(shard, None)
+    assert again["complete"] is True
+    assert again["sent"] == 0
+    assert len(ses.sent("send_email")) == first["sent"]
+
+
+def test_send_newsletter_coordinator_rerun_keeps_shards(initialiseShards):
+    first = send_newsletter(coordinator_event(), None)
+    second = send_newsletter(dict(coordinator_event(), shards=5), None)
+    assert second["email_sent_date"] == first["email_sent_date"]
+    assert len(second["shards"]) == 3
+
+
+def test_send_newsletter_coordinator_after_unsharded_send(initialiseShards):
+    ddb, ses, emails = initialiseShards
+    unsharded = coordinator_event()
+    del unsharded["shards"]
+    first = send_newsletter(unsharded, None)
+    response = send_newsletter(coordinator_event(), None)
+    assert response == {"email_sent_date": first["email_sent_date"], "shards": []}
+    assert len(ses.sent("send_email")) == len(emails)
+
+
+def test_send_newsletter_refuses_to_carry_on_sharded_send_unsharded(
+    initialiseShards,
+):
+    ddb, ses, emails = initialiseShards
+    response = send_newsletter(coordinator_event(), None)
+    for shard in response["shards"]:
+        send_newsletter_shard(shard, None)
+    unsharded = coordinator_event()
+    del unsharded["shards"]
+    with pytest.raises(ValueError, match="in shards"):
+        send_newsletter(unsharded, None)
+    assert len(ses.sent("send_email")) == len(emails)
+
+
+def test_send_newsletter_shards_share_the_send_rate(initialiseShards):
+    ddb, ses, emails = initialiseShards
+    ses.quota = {"Max24HourSend": 16.0, "MaxSendRate": 9.0, "SentLast24Hours": 4.0}
+    [shard, *_] = send_newsletter(coordinator_event(), None)["shards"]
+    # Each of the 3 shards may send a third of the 12 messages left today
+    response = send_newsletter_shard(shard, None)
+    assert response["remaining_quota"] == 4 - response["sent"]
+
+
+def test_send_newsletter_coordinator_refuses_partial_unsharded_send(
+    initialiseShards,
+):
+    ddb, ses, emails = initialiseShards
+    ddb.put_item(
+        TableName="meadow-users",
+        Item={
+            "partitionKey": {"S": "CAMPAIGN#20210421"},
+            "sortKey": {"S": "CAMPAIGN"},
+            "email_sent_date": {"S": "20210421000000"},
+            "status": {"S": "sending"},
+            "sent": {"N": "4"},
+            "failed": {"N": "0"},
+        },
+    )
+    with pytest.raises(ValueError, match="unsharded"):
+        send_newsletter(coordinator_event(), None)
+    assert ses.sent("send_email") == []
+
+
+def test_send_newsletter_shards_fit_subscriber_shards(initialise, fakeSes):
+    ssm = initialise[1]
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = dict(json.loads(parameter["Value"]), subscriber_shards=2)
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+    handler.get_context().load()
+    handler.get_context().ses = fakeSes
+    response = send_newsletter(dict(coordinator_event(), shards=4), None)
+    assert len(response["shards"]) == 2
+    # A worker left with no SUBSCRIBED#<n> keys still finishes its send
+    idle = dict(response["shards"][0], segment=3, total_segments=4)
+    assert send_newsletter_shard(idle, None)["complete"] is True
+
+
+def test_send_newsletter_shard_without_details(initialiseShards):
+    with pytest.raises(KeyError, match="segment"):
+        send_newsletter_shard(
+            {
+                "newsletter_slug": "20210421",
+                "newsletter_subject": "Meadow Testing Newsletter",
+            },
+            None,
+        )
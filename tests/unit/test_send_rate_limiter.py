@@ -0,0 +1,99 @@
+import pytest
+
+from handlers.handler import SendQuotaExhausted, SendRateLimiter
+
+
+class FakeClock:
+    # Time only moves when the limiter sleeps
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def limiter_for(ses, clock):
+    return SendRateLimiter(ses, backoff=0.1, clock=clock, sleep=clock.sleep)
+
+
+def test_send_rate_limiter_paces_to_max_send_rate(fakeSes):
+    ses = fakeSes
+    ses.quota["MaxSendRate"] = 2.0
+    clock = FakeClock()
+    limiter = limiter_for(ses, clock)
+    for _ in range(6):
+        limiter.acquire()
+    # Two sends fit in the full bucket, the rest wait half a second each
+    assert clock.sleeps == [0.5, 0.5, 0.5, 0.5]
+
+
+def test_send_rate_limiter_reads_quota_once(fakeSes):
+    ses = fakeSes
+    limiter = limiter_for(ses, FakeClock())
+    for _ in range(3):
+        limiter.acquire()
+    assert len(ses.sent("get_send_quota")) == 1
+    assert limiter.remaining == 49997
+
+
+def test_send_rate_limiter_retries_throttled_sends(fakeSes):
+    ses = fakeSes
+    ses.throttle = 3
+    clock = FakeClock()
+    limiter = limiter_for(ses, clock)
+    limiter.wrap(ses.send_email)(Destination={"ToAddresses": ["test@test.test"]})
+    assert len(ses.sent("send_email")) == 1
+    assert len(clock.sleeps) == 3
+    # Jittered backoff never waits longer than the exponential ceiling
+    for attempt, seconds in enumerate(clock.sleeps):
+        assert 0 <= seconds <= 0.1 * 2 ** attempt
+
+
+def test_send_rate_limiter_gives_up_after_retries(fakeSes):
+    ses = fakeSes
+    ses.throttle = 100
+    limiter = SendRateLimiter(ses, retries=2, sleep=lambda seconds: None)
+    with pytest.raises(Exception, match="Throttling"):
+        limiter.wrap(ses.send_email)(Destination={"ToAddresses": ["t@test.test"]})
+
+
+def test_send_rate_limiter_stops_at_daily_quota(fakeSes):
+    ses = fakeSes
+    ses.quota = {"Max24HourSend": 200.0, "MaxSendRate": 1.0, "SentLast24Hours": 199.0}
+    limiter = limiter_for(ses, FakeClock())
+    limiter.acquire()
+    assert limiter.exhausted
+    with pytest.raises(SendQuotaExhausted):
+        limiter.acquire()
+
+
+def test_send_rate_limiter_takes_what_is_left_of_daily_quota(fakeSes):
+    ses = fakeSes
+    ses.quota = {"Max24HourSend": 200.0, "MaxSendRate": 100.0, "SentLast24Hours": 170.0}
+    limiter = limiter_for(ses, FakeClock())
+    assert limiter.acquire(50, partial=True) == 30
+    assert limiter.exhausted
+    with pytest.raises(SendQuotaExhausted):
+        limiter.acquire(50, partial=True)
+
+
+def test_send_rate_limiter_shares_quota(fakeSes):
+    ses = fakeSes
+    ses.quota = {"Max24HourSend": 200.0, "MaxSendRate": 8.0, "SentLast24Hours": 100.0}
+    limiter = SendRateLimiter(ses, share=4)
+    assert limiter.rate == 2.0
+    assert limiter.remaining == 25
+
+
+def test_send_rate_limiter_unlimited_daily_quota(fakeSes):
+    ses = fakeSes
+    ses.quota["Max24HourSend"] = -1.0
+    limiter = limiter_for(ses, FakeClock())
+    limiter.acquire(50)
+    assert limiter.remaining is None
+    assert not limiter.exhausted
@@ -0,0 +1,108 @@
+import logging
+
+import botocore.exceptions
+
+from handlers.handler import SentRecordBuffer, batch_write_items
+
+
+class FakeBatchClient:
+    # Leaves the first item of every batch unprocessed until told otherwise
+    def __init__(self, unprocessed_rounds):
+        self.unprocessed_rounds = unprocessed_rounds
+        self.requests = []
+        self.written = []
+
+    def batch_write_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        [(table_name, puts)] = RequestItems.items()
+        if self.unprocessed_rounds:
+            self.unprocessed_rounds -= 1
+            self.written.extend(put["PutRequest"]["Item"] for put in puts[1:])
+            return {"UnprocessedItems": {table_name: puts[:1]}}
+        self.written.extend(put["PutRequest"]["Item"] for put in puts)
+        return {"UnprocessedItems": {}}
+
+
+class FakeTable:
+    # Writes single items straight to the client's list, or fails if put_fails
+    def __init__(self, client, put_fails=False):
+        self.name = "meadow-users"
+        self.meta = type("Meta", (), {"client": client})
+        self.put_fails = put_fails
+
+    def put_item(self, Item):
+        if self.put_fails:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+                "PutItem",
+            )
+        self.meta.client.written.append(Item)
+
+
+def test_sent_record_buffer_writes_in_batches():
+    client = FakeBatchClient(0)
+    buffer = SentRecordBuffer(FakeTable(client), backoff=0)
+    for n in range(60):
+        buffer.add(str(n) + "@test.test", "20210421000000", "12345678")
+    # Two full batches are written as soon as they fill up
+    assert len(client.requests) == 2
+    buffer.flush()
+    assert [len(request["meadow-users"]) for request in client.requests] == [
+        25,
+        25,
+        10,
+    ]
+    assert len(client.written) == 60
+    assert client.written[0]["sortKey"] == "EMAIL_SENT#20210421000000"
+
+
+def test_sent_record_buffer_retries_unprocessed_items():
+    client = FakeBatchClient(2)
+    buffer = SentRecordBuffer(FakeTable(client), backoff=0)
+    buffer.add("test@test.test", "20210421000000", "12345678")
+    buffer.add("other@test.test", "20210421000000", "12345678")
+    buffer.flush()
+    assert len(client.requests) == 3
+    assert len(client.written) == 2
+    assert buffer.unwritten == []
+
+
+def test_sent_record_buffer_writes_leftovers_singly():
+    client = FakeBatchClient(10)
+    buffer = SentRecordBuffer(FakeTable(client), retries=2, backoff=0)
+    buffer.add("test@test.test", "20210421000000", "12345678")
+    buffer.add("other@test.test", "20210421000000", "12345678")
+    buffer.flush()
+    assert len(client.requests) == 3
+    assert sorted(item["partitionKey"] for item in client.written) == [
+        "other@test.test",
+        "test@test.test",
+    ]
+    assert buffer.unwritten == []
+
+
+def test_sent_record_buffer_keeps_items_it_cannot_write():
+    client = FakeBatchClient(10)
+    buffer = SentRecordBuffer(FakeTable(client, put_fails=True), retries=2, backoff=0)
+    buffer.add("test@test.test", "20210421000000", "12345678")
+    buffer.flush()
+    assert len(client.requests) == 3
+    assert buffer.unwritten[0]["partitionKey"] == "test@test.test"
+
+
+class FailingBatchClient:
+    def batch_write_item(self, RequestItems):
+        raise botocore.exceptions.ClientError(
+            {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+            "BatchWriteItem",
+        )
+
+
+def test_batch_write_items_logs_client_errors(caplog):
+    caplog.set_level(logging.INFO)
+    item = {"partitionKey": "test@test.test", "sortKey": "EMAIL_SENT#1"}
+    table = FakeTable(FailingBatchClient())
+    assert batch_write_items(table, [item], retries=1, backoff=0) == [item]
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 2
+    assert "ProvisionedThroughputExceededException" in messages[0]
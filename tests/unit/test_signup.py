@@ -1,9 +1,11 @@
 import base64
+import time
 import urllib.parse
 
 import pytest
 
-from handlers.handler import signup
+from handlers import handler
+from handlers.handler import drain_outbox, send_validation_email, signup
 
 
 def api_gateway_event(payload: dict) -> dict:
@@ -49,3 +51,145 @@ def test_newsletter_signup_email_already_exists(initialise):
 def test_newsletter_signup_no_email(initialise):
     with pytest.raises(Exception):
         signup(api_gateway_event({}), None)
+
+
+class FakeLambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **request):
+        self.invocations.append(request)
+        return {"StatusCode": 202}
+
+
+def outbox(ddb, partition="OUTBOX"):
+    return ddb.query(
+        TableName="meadow-users",
+        KeyConditionExpression="partitionKey = :outbox",
+        ExpressionAttributeValues={":outbox": {"S": partition}},
+    )["Items"]
+
+
+def signup_record(ddb):
+    ddb.put_item(
+        TableName="meadow-users",
+        Item={
+            "partitionKey": {"S": "test@test.test"},
+            "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+            "random_string": {"S": "12345678"},
+        },
+    )
+
+
+def test_newsletter_signup_writes_outbox(initialiseWithFakeSes, monkeypatch):
+    ddb, fake_ses = initialiseWithFakeSes[0], initialiseWithFakeSes[2]
+    monkeypatch.setenv("OUTBOX_FUNCTION", "drain_outbox")
+    fake_lambda = handler.get_context().clients["lambda"] = FakeLambda()
+    email = "test@test.test"
+    response = signup(api_gateway_event({"email": email, "secret": "11111111"}), None)
+    assert response["statusCode"] == 301
+    # The email is left in the outbox for the asynchronous drain
+    [invocation] = fake_lambda.invocations
+    assert invocation["FunctionName"] == "drain_outbox"
+    assert invocation["InvocationType"] == "Event"
+    assert fake_ses.sent("send_email") == []
+    [item] = outbox(ddb)
+    assert item["email"]["S"] == email
+
+    assert drain_outbox({}, None)["sent"] == 1
+    assert len(fake_ses.sent("send_email")) == 1
+    assert outbox(ddb) == []
+
+
+def test_newsletter_signup_existing_email_writes_no_outbox(initialiseWithFakeSes):
+    ddb, fake_ses = initialiseWithFakeSes[0], initialiseWithFakeSes[2]
+    signup_record(ddb)
+    response = signup(
+        api_gateway_event({"email": "test@test.test", "secret": "11111111"}), None
+    )
+    assert response["statusCode"] == 301
+    assert outbox(ddb) == []
+    assert fake_ses.sent("send_email") == []
+
+
+def test_drain_outbox_keeps_failed_emails(initialiseWithFakeSes):
+    ddb, fake_ses = initialiseWithFakeSes[0], initialiseWithFakeSes[2]
+    fake_ses.fail_for.add("test@test.test")
+    response = signup(
+        api_gateway_event({"email": "test@test.test", "secret": "11111111"}), None
+    )
+    assert response["statusCode"] == 301
+    assert len(outbox(ddb)) == 1
+
+    # Sent by the next drain once SES accepts it
+    fake_ses.fail_for.clear()
+    assert drain_outbox({}, None) == {"sent": 1, "failed": 0, "errors": []}
+    assert outbox(ddb) == []
+
+
+def test_drain_outbox_sends_past_broken_emails(initialiseWithFakeSes):
+    ddb, fake_ses = initialiseWithFakeSes[0], initialiseWithFakeSes[2]
+    broken = handler.outbox_item("welcome", "other@test.test", "x", "20210421000000")
+    handler.get_context().table.put_item(Item=broken)
+    signup(api_gateway_event({"email": "test@test.test", "secret": "11111111"}), None)
+    assert len(fake_ses.sent("send_email")) == 1
+    response = drain_outbox({}, None)
+    assert response["failed"] == 1
+    assert "Unknown outbox email" in response["errors"][0]["error"]
+    assert [item["email"]["S"] for item in outbox(ddb)] == ["other@test.test"]
+
+
+def test_newsletter_signup_without_validation_template(initialiseWithFakeSes):
+    ddb, s3 = initialiseWithFakeSes[0], initialiseWithFakeSes[3]
+    s3.delete_object(Bucket="my-barn", Key="transactional/validate.j2")
+    response = signup(
+        api_gateway_event({"email": "test@test.test", "secret": "11111111"}), None
+    )
+    # Left in the outbox for a drain once the template is back
+    assert response["statusCode"] == 301
+    assert len(outbox(ddb)) == 1
+
+
+def test_drain_outbox_skips_claimed_emails(initialiseWithFakeSes):
+    ddb, fake_ses = initialiseWithFakeSes[0], initialiseWithFakeSes[2]
+    fake_ses.fail_for.add("test@test.test")
+    signup(api_gateway_event({"email": "test@test.test", "secret": "11111111"}), None)
+    fake_ses.fail_for.clear()
+
+    # Another drain is part way through sending it
+    [item] = outbox(ddb)
+    claimed_until = int(time.time()) + handler.OUTBOX_CLAIM_SECONDS
+    item["claimed_until"] = {"N": str(claimed_until)}
+    ddb.put_item(TableName="meadow-users", Item=item)
+    assert drain_outbox({}, None) == {"sent": 0, "failed": 0, "errors": []}
+    assert fake_ses.sent("send_email") == []
+    assert len(outbox(ddb)) == 1
+
+
+def test_drain_outbox_parks_emails_that_keep_failing(initialiseWithFakeSes):
+    ddb, fake_ses = initialiseWithFakeSes[0], initialiseWithFakeSes[2]
+    fake_ses.fail_for.add("test@test.test")
+    signup(api_gateway_event({"email": "test@test.test", "secret": "11111111"}), None)
+    for _ in range(handler.OUTBOX_MAX_ATTEMPTS - 2):
+        assert drain_outbox({}, None)["failed"] == 1
+    assert outbox(ddb)[0]["attempts"]["N"] == str(handler.OUTBOX_MAX_ATTEMPTS - 1)
+
+    assert drain_outbox({}, None)["failed"] == 1
+    assert outbox(ddb) == []
+    [parked] = outbox(ddb, "OUTBOX_FAILED")
+    assert parked["email"]["S"] == "test@test.test"
+    assert "MessageRejected" in parked["error"]["S"]
+    assert drain_outbox({}, None) == {"sent": 0, "failed": 0, "errors": []}
+
+
+def test_send_validation_email_skips_repeated_send(initialiseWithFakeSes):
+    ddb, fake_ses = initialiseWithFakeSes[0], initialiseWithFakeSes[2]
+    signup_record(ddb)
+    request = {
+        "email": "test@test.test",
+        "random_string": "12345678",
+        "email_sent_date": "20210421000000",
+    }
+    send_validation_email(request, None)
+    send_validation_email(request, None)
+    assert len(fake_ses.sent("send_email")) == 1
@@ -0,0 +1,38 @@
+import threading
+
+from handlers import handler
+from handlers.handler import TOKEN_ALPHABET, TOKEN_LENGTH, TokenGenerator
+
+
+def test_tokens_keep_link_format():
+    tokens = handler.random_tokens(1000) + [handler.random_token()]
+    assert all(len(token) == TOKEN_LENGTH for token in tokens)
+    assert set("".join(tokens)) <= set(TOKEN_ALPHABET)
+    assert len(set(tokens)) == len(tokens)
+
+
+def test_tokens_use_whole_alphabet():
+    # 64,000 characters, so every one of the 36 should turn up
+    assert set("".join(TokenGenerator().tokens(2000))) == set(TOKEN_ALPHABET)
+
+
+def test_tokens_larger_than_batch():
+    generator = TokenGenerator(batch=4)
+    assert len(generator.tokens(100)) == 100
+    assert len(generator.tokens(3)) == 3
+
+
+def test_tokens_shared_between_threads():
+    generator = TokenGenerator(batch=8)
+    tokens = []
+
+    def take():
+        for _ in range(200):
+            tokens.append(generator.token())
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(tokens)) == 1600
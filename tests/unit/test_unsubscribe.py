@@ -1,8 +1,10 @@
 import base64
+import json
+import urllib.parse
 
 import pytest
 
-from handlers.handler import unsubscribe
+from handlers.handler import build_unsubscribe_url, unsubscribe
 
 
 def api_gateway_event(payload: dict) -> dict:
@@ -240,3 +242,118 @@ def test_newsletter_unsubscribe_missing_element(initialise):
         ProjectionExpression="is_subscribed",
     )
     assert post_unsubscribe_record["Item"]["is_subscribed"]["S"] == "true"
+
+
+def use_unsubscribe_secret(ssm):
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = json.loads(parameter["Value"])
+    meadow["unsubscribe_secret"] = "unsubscribe-secret"
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+    return meadow
+
+
+def signed_unsubscribe_event(meadow, email, email_sent_date):
+    url = build_unsubscribe_url(meadow, email, None, email_sent_date)
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    return api_gateway_event({name: values[0] for name, values in query.items()})
+
+
+def test_newsletter_unsubscribe_signed_link(initialise):
+    ddb, ssm = initialise[0], initialise[1]
+    meadow = use_unsubscribe_secret(ssm)
+    # No EMAIL_SENT record is needed
+    ddb.put_item(TableName="meadow-users", Item=subscription_record())
+    email = "test@test.test"
+    event = signed_unsubscribe_event(meadow, email, "20210226010203")
+    assert "random_string" not in event["queryStringParameters"]
+    response = unsubscribe(event, None)
+    assert response["statusCode"] == 301
+    post_unsubscribe_record = ddb.get_item(
+        TableName="meadow-users",
+        Key={"partitionKey": {"S": email}, "sortKey": {"S": "NEWSLETTER_SIGNUP"}},
+        ConsistentRead=True,
+        ProjectionExpression="is_subscribed",
+    )
+    assert post_unsubscribe_record["Item"]["is_subscribed"]["S"] == "false"
+
+
+def test_newsletter_unsubscribe_signed_link_for_other_email(initialise):
+    ddb, ssm = initialise[0], initialise[1]
+    meadow = use_unsubscribe_secret(ssm)
+    ddb.put_item(TableName="meadow-users", Item=subscription_record())
+    event = signed_unsubscribe_event(meadow, "other@test.test", "20210226010203")
+    event["queryStringParameters"]["email"] = base64.urlsafe_b64encode(
+        b"test@test.test"
+    ).decode("ascii")
+    with pytest.raises(AssertionError):
+        unsubscribe(event, None)
+
+
+def test_newsletter_unsubscribe_signed_link_without_secret(initialise):
+    ddb = initialise[0]
+    ddb.put_item(TableName="meadow-users", Item=subscription_record())
+    meadow = {"meadow_domain": "meadow.test", "unsubscribe_secret": "guessed"}
+    event = signed_unsubscribe_event(meadow, "test@test.test", "20210226010203")
+    with pytest.raises(AssertionError):
+        unsubscribe(event, None)
+
+
+def test_newsletter_unsubscribe_legacy_link_with_secret(initialise):
+    ddb, ssm = initialise[0], initialise[1]
+    use_unsubscribe_secret(ssm)
+    ddb.put_item(TableName="meadow-users", Item=subscription_record())
+    ddb.put_item(TableName="meadow-users", Item=newsletter_record())
+    response = unsubscribe(
+        api_gateway_event(
+            {
+                "email": base64.urlsafe_b64encode(b"test@test.test").decode("ascii"),
+                "email_sent": "20210226010203",
+                "random_string": "12345678",
+            }
+        ),
+        None,
+    )
+    assert response["statusCode"] == 301
+
+
+def test_newsletter_unsubscribe_sparse_index(initialise):
+    ddb, ssm = initialise[0], initialise[1]
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = json.loads(parameter["Value"])
+    meadow["subscriber_shards"] = 4
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+    record = subscription_record()
+    record["subscribed_shard"] = {"S": "SUBSCRIBED#1"}
+    ddb.put_item(TableName="meadow-users", Item=record)
+    ddb.put_item(TableName="meadow-users", Item=newsletter_record())
+    response = unsubscribe(
+        api_gateway_event(
+            {
+                "email": base64.urlsafe_b64encode(b"test@test.test").decode("ascii"),
+                "email_sent": "20210226010203",
+                "random_string": "12345678",
+            }
+        ),
+        None,
+    )
+    assert response["statusCode"] == 301
+    post_unsubscribe_record = ddb.get_item(
+        TableName="meadow-users",
+        Key={
+            "partitionKey": {"S": "test@test.test"},
+            "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+        },
+        ConsistentRead=True,
+    )["Item"]
+    assert "is_subscribed" not in post_unsubscribe_record
+    assert "subscribed_shard" not in post_unsubscribe_record
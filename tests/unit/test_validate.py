@@ -1,8 +1,9 @@
 import base64
+import json
 
 import pytest
 
-from handlers.handler import validate
+from handlers.handler import subscriber_shard, validate
 
 
 def api_gateway_event(payload: dict) -> dict:
@@ -141,3 +142,42 @@ def test_newsletter_no_random_string(initialise):
             ),
             None,
         )
+
+
+def test_newsletter_validate_sharded_index(initialise):
+    ddb, ssm = initialise[0], initialise[1]
+    parameter = ssm.get_parameter(Name="MeadowDictionary")["Parameter"]
+    meadow = json.loads(parameter["Value"])
+    meadow["subscriber_shards"] = 4
+    ssm.put_parameter(
+        Name="MeadowDictionary",
+        Value=json.dumps(meadow),
+        Type="String",
+        Overwrite=True,
+    )
+    ddb.put_item(
+        TableName="meadow-users",
+        Item={
+            "partitionKey": {"S": "test@test.test"},
+            "sortKey": {"S": "NEWSLETTER_SIGNUP"},
+            "random_string": {"S": "12345678"},
+        },
+    )
+    email = "test@test.test"
+    response = validate(
+        api_gateway_event(
+            {
+                "email": base64.urlsafe_b64encode(email.encode()).decode("ascii"),
+                "random_string": "12345678",
+            }
+        ),
+        None,
+    )
+    assert response["statusCode"] == 301
+    record = ddb.get_item(
+        TableName="meadow-users",
+        Key={"partitionKey": {"S": email}, "sortKey": {"S": "NEWSLETTER_SIGNUP"}},
+        ConsistentRead=True,
+    )["Item"]
+    assert "is_subscribed" not in record
+    assert record["subscribed_shard"]["S"] == subscriber_shard(email, 4)
@@ -28,4 +28,19 @@ variable "website_domain" {
 
 variable "honeypot_secret" {
   type = string
-}
\ No newline at end of file
+}
+
+// Signs unsubscribe links when set, so newsletters need no EMAIL_SENT records
+variable "unsubscribe_secret" {
+  type      = string
+  default   = ""
+  sensitive = true
+}
+
+// Spreads subscribers over this many keys of the subscribed_shard index, 0 keeps
+// the is_subscribed index. Run migrate_subscribers after changing it. Migrated
+// subscribers are only in the subscribed_shard index, so it can't go back to 0
+variable "subscriber_shards" {
+  type    = number
+  default = 0
+}